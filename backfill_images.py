@@ -1,62 +1,59 @@
 import asyncio
-from playwright.async_api import async_playwright
+from browser_session import BrowserSession, TabPool
+from database import migrate, load_media_manifest
+from image_store import ImageStore
+from media import MediaDownloader, fetch_bytes, capture_element
+import argparse
 import sqlite3
+import time
 import os
 import re
 import random
-import base64
 
 DB_NAME = "smtf_memory.db"
-USER_DATA_DIR = os.path.join(os.getcwd(), "browser_data")
-IMG_DIR = "assets/images"
-
-
-async def download_image_via_js(page, url):
-    """
-    Plan A: JS 注入下载。
-    利用浏览器当前的上下文发起请求，完美继承 Referer 和 Cookie。
-    """
-    js_code = """
-    async (url) => {
-        try {
-            const response = await fetch(url);
-            if (!response.ok) throw new Error(response.statusText);
-            const blob = await response.blob();
-            return new Promise((resolve, reject) => {
-                const reader = new FileReader();
-                reader.onloadend = () => resolve(reader.result);
-                reader.onerror = reject;
-                reader.readAsDataURL(blob);
-            });
-        } catch (err) {
-            return null;
-        }
-    }
-    """
-    try:
-        # 执行 JS
-        data_url = await page.evaluate(js_code, url)
-        if data_url and "base64," in data_url:
-            _, encoded = data_url.split(",", 1)
-            return base64.b64decode(encoded)
-    except:
-        pass
-    return None
-
-
-async def process_page(page, url, post_id, platform):
-    filename = f"{IMG_DIR}/{post_id}.jpg"
 
+# 并行的 tab 数 / 同一域名两次打开页面的最小间隔 (秒)
+BACKFILL_TABS = int(os.getenv("SMTF_BACKFILL_TABS", "4"))
+BACKFILL_INTERVAL = float(os.getenv("SMTF_BACKFILL_INTERVAL", "1.0"))
+STEALTH_JS = "Object.defineProperty(navigator, 'webdriver', {get: () => undefined});"
+
+# 失败重试: 第 n 次失败后等 RETRY_HOURS * 2^(n-1) 小时，失败 MAX_ATTEMPTS 次后放弃
+BACKFILL_RETRY_HOURS = float(os.getenv("SMTF_BACKFILL_RETRY_HOURS", "6"))
+BACKFILL_MAX_ATTEMPTS = int(os.getenv("SMTF_BACKFILL_MAX_ATTEMPTS", "4"))
+# 每攒多少条结果提交一次 (中断后最多重跑这么多条)
+BACKFILL_COMMIT_EVERY = 20
+
+# 回填结果
+SAVED = "saved"          # 拿到图片
+NO_IMAGE = "no_image"    # 页面正常打开但没有图片 (纯文字帖)，永久跳过
+FAILED = "failed"        # 打不开 / 没渲染出来 / 下载失败，按 retry_after 重试
+
+# 按清单直接下载时带的 Referer
+REFERERS = {
+    "x": "https://x.com/",
+    "wb": "https://weibo.com/",
+}
+
+# 页面真的渲染出了帖子正文 (用来区分"没图"和"没加载出来/被登录墙挡住")
+POST_SELECTORS = {
+    "x": 'article[data-testid="tweet"]',
+    "wb": "article",
+}
+
+
+async def process_page(page, url, post_id, platform, store):
+    """访问帖子页面找图，返回 (outcome, local_path)"""
     try:
         try:
             # 1. 访问页面
             await page.goto(url, wait_until="domcontentloaded", timeout=45000)
+            await page.wait_for_selector(POST_SELECTORS[platform], timeout=15000)
+        except Exception:
+            return FAILED, None
 
-            # [关键] 随机行为模拟
-            delay = random.uniform(1.5, 3.5)
-            # print(f"       Thinking for {delay:.1f}s...")
-            await asyncio.sleep(delay)
-
+        # [关键] 随机行为模拟
+        await asyncio.sleep(random.uniform(1.5, 3.5))
+        try:
             # 滚动触发懒加载
             await page.mouse.wheel(0, 500)
             await asyncio.sleep(1.0)
@@ -70,7 +67,11 @@ async def process_page(page, url, post_id, platform):
         # 策略 A: X (Twitter)
         # ==========================
         if platform == "x":
+            # 图片容器和正文一起渲染: 推文里根本没有 tweetPhoto 才算纯文字；
+            # 有容器但图片 5 秒内没加载出来算失败 (可重试)，不能记成 NO_IMAGE
             try:
+                if await page.locator('[data-testid="tweetPhoto"]').count() == 0:
+                    return NO_IMAGE, None
                 await page.wait_for_selector('[data-testid="tweetPhoto"] img', timeout=5000)
                 photo_divs = await page.locator('[data-testid="tweetPhoto"] img').all()
                 if photo_divs:
@@ -78,18 +79,23 @@ async def process_page(page, url, post_id, platform):
                     src = await target_img_element.get_attribute("src")
                     if src:
                         target_src_hd = re.sub(r"name=\w+", "name=orig", src) if "name=" in src else src
-            except:
-                pass
+            except Exception:
+                return FAILED, None
+            if target_img_element is None:
+                return FAILED, None
 
         # ==========================
         # 策略 B: Weibo (严格筛选)
         # ==========================
         elif platform == "wb":
+            # 和 X 一样: 正文里没有配图容器才算纯文字 (article img 总能匹配到头像/图标，不能作为依据)；
+            # 有容器但图片没加载出来 / 全被过滤掉算失败 (可重试)
             try:
+                if await page.locator('article .woo-picture-main, article .pic-box').count() == 0:
+                    return NO_IMAGE, None
                 locators = [
                     'article .woo-picture-main img',
                     'article .pic-box img',
-                    'article img'
                 ]
 
                 found_imgs = []
@@ -123,62 +129,94 @@ async def process_page(page, url, post_id, platform):
                         break
                     except:
                         continue
-            except:
-                pass
+            except Exception:
+                return FAILED, None
+            if target_img_element is None:
+                return FAILED, None
 
         # ==========================
         # 执行下载 (Plan A -> Plan B)
         # ==========================
-        if target_img_element:
-            downloaded = False
-
-            # [Plan A] JS Fetch 高清图 (优先尝试)
-            if target_src_hd:
-                img_bytes = await download_image_via_js(page, target_src_hd)
-                if img_bytes and len(img_bytes) > 2000:
-                    with open(filename, "wb") as f:
-                        f.write(img_bytes)
-                    downloaded = True
-
-            # [Plan B] 截图兜底 (如果 Plan A 418 或者失败)
-            if not downloaded:
-                try:
-                    # 确保元素在视口内
-                    await target_img_element.scroll_into_view_if_needed()
-                    await asyncio.sleep(0.5)
-                    # 截图保存为 JPG (质量85)
-                    await target_img_element.screenshot(path=filename, type="jpeg", quality=85)
-                    downloaded = True
-                    print(f"       📸 Plan B (Screenshot) Saved")
-                except Exception:
-                    pass
-
-            if downloaded:
-                return filename
+        if target_img_element is None:
+            return NO_IMAGE, None
+
+        # [Plan A] 高清图直接走 context 请求通道 (二进制，带 cookie + Referer)
+        if target_src_hd:
+            img_bytes = await fetch_bytes(page, target_src_hd)
+            if img_bytes:
+                return SAVED, store.put(img_bytes)
+
+        # [Plan B] 截图兜底 (如果 Plan A 418 或者失败): CDP 按元素区域裁剪截图
+        shot = await capture_element(page, target_img_element, quality=85)
+        if shot:
+            print(f"       📸 Plan B (Screenshot) Saved")
+            return SAVED, store.put(shot, "jpg")
 
     except Exception as e:
         print(f"    [!] Error: {e}")
 
-    return None
+    return FAILED, None
+
+
+def retry_after(outcome, attempts, now):
+    """下次可以重试的时间；None 表示不再重试"""
+    if outcome != FAILED or attempts >= BACKFILL_MAX_ATTEMPTS:
+        return None
+    return now + int(BACKFILL_RETRY_HOURS * 3600 * (2 ** (attempts - 1)))
 
 
-async def run_backfill():
+def select_pending(conn, now):
+    """
+    需要回填的帖子: 没有图片，且从没尝试过 / 上次失败且已过了 retry_after。
+    纯文字帖 (no_image) 和放弃的失败记录不会再出现。
+    """
+    return conn.execute('''
+        SELECT p.post_id, p.url, COALESCE(a.attempts, 0)
+        FROM processed_posts p
+        LEFT JOIN backfill_attempts a ON a.post_id = p.post_id
+        WHERE p.url IS NOT NULL AND p.url != ''
+        AND (p.image_path IS NULL OR p.image_path = '')
+        AND p.platform IN ('x', 'wb')
+        AND (a.post_id IS NULL OR (a.outcome = ? AND a.retry_after IS NOT NULL AND a.retry_after <= ?))
+        ORDER BY p.processed_ts DESC
+    ''', (FAILED, now)).fetchall()
+
+
+def record_attempts(conn, results):
+    """把一批 (post_id, outcome, attempts, local_path) 写进库，一个事务提交"""
+    now = int(time.time())
+    with conn:
+        conn.executemany('''
+            INSERT INTO backfill_attempts (post_id, outcome, attempts, last_attempt_ts, retry_after)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(post_id) DO UPDATE SET
+                outcome = excluded.outcome,
+                attempts = excluded.attempts,
+                last_attempt_ts = excluded.last_attempt_ts,
+                retry_after = excluded.retry_after
+        ''', [(post_id, outcome, attempts, now, retry_after(outcome, attempts, now))
+              for post_id, outcome, attempts, _ in results])
+        conn.executemany(
+            "UPDATE processed_posts SET image_path = ? WHERE post_id = ?",
+            [(path, post_id) for post_id, outcome, _, path in results if outcome == SAVED]
+        )
+
+
+async def run_backfill(reset_cache=False):
     if not os.path.exists(DB_NAME):
         print("❌ Database not found.")
         return
 
-    os.makedirs(IMG_DIR, exist_ok=True)
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    store = ImageStore()
+    conn = sqlite3.connect(DB_NAME, timeout=30.0)
+    migrate(conn)
+
+    if reset_cache:
+        # 清掉负缓存 (纯文字 / 放弃的记录)，全部重新尝试
+        with conn:
+            conn.execute("DELETE FROM backfill_attempts WHERE outcome != ?", (SAVED,))
 
-    cursor.execute('''
-        SELECT post_id, url FROM processed_posts 
-        WHERE url IS NOT NULL 
-        AND url != '' 
-        AND (image_path IS NULL OR image_path = '')
-        AND (post_id LIKE 'x_%' OR post_id LIKE 'wb_%')
-    ''')
-    rows = cursor.fetchall()
+    rows = select_pending(conn, int(time.time()))
 
     if not rows:
         print("✅ No missing images.")
@@ -187,42 +225,87 @@ async def run_backfill():
 
     print(f"[*] Found {len(rows)} posts needing image backfill...")
 
-    async with async_playwright() as p:
-        ua = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36"
-        context = await p.chromium.launch_persistent_context(
-            USER_DATA_DIR,
-            headless=False,
-            args=["--disable-blink-features=AutomationControlled"],
-            viewport={"width": 1280, "height": 800},
-            user_agent=ua
-        )
-        page = await context.new_page()
-        await page.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined});")
-
-        updated_count = 0
+    session = BrowserSession()
+
+    # 每条结果都进 backfill_attempts，攒一批提交一次；中断 (Ctrl+C) 时 finally 里把已完成的落盘，
+    # 下次运行自动跳过已经有结论的帖子
+    batch = []
+    counts = {SAVED: 0, NO_IMAGE: 0, FAILED: 0}
+    finished = 0
+
+    def finish(post_id, outcome, attempts, local_path, total):
+        nonlocal batch, finished
+        finished += 1
+        counts[outcome] += 1
+        batch.append((post_id, outcome, attempts + 1, local_path))
+        if outcome == SAVED:
+            print(f"[{finished}/{total}] ✅ {post_id} saved.")
+        elif outcome == NO_IMAGE:
+            print(f"[{finished}/{total}] -- {post_id}: text only, skipped from now on.")
+        else:
+            print(f"[{finished}/{total}] ⚠️ {post_id}: no image captured (attempt {attempts + 1}).")
+        if len(batch) >= BACKFILL_COMMIT_EVERY:
+            record_attempts(conn, batch)
+            batch = []
 
-        for i, (post_id, url) in enumerate(rows):
-            print(f"[{i + 1}/{len(rows)}] Processing {post_id} ...")
+    try:
+        # 1. 采集时记过图片清单的帖子: 直接按 URL 批量下载 (context 请求通道，带 cookie)，不打开页面
+        manifest = load_media_manifest(conn, [row[0] for row in rows])
+        if manifest:
+            print(f"    -> {len(manifest)} posts have a media manifest, fetching directly...")
+            downloader = MediaDownloader(store)
+            page = await session.new_page()
+
+            async def fetch_listed(row):
+                post_id, _, attempts = row
+                referer = REFERERS["x" if post_id.startswith("x_") else "wb"]
+                urls = [m["url"] for m in manifest[post_id]]
+                try:
+                    return row, await downloader.save_first(page, urls, referer=referer)
+                except Exception as e:
+                    print(f"    [!] Direct fetch failed ({post_id}): {e}")
+                    return row, None
 
+            try:
+                tasks = [fetch_listed(row) for row in rows if row[0] in manifest]
+                saved_ids = set()
+                for future in asyncio.as_completed(tasks):
+                    (post_id, _, attempts), local_path = await future
+                    if local_path:
+                        saved_ids.add(post_id)
+                        finish(post_id, SAVED, attempts, local_path, len(rows))
+            finally:
+                await page.close()
+            # 直接下载失败的 (URL 过期等) 交给下面的页面访问兜底
+            rows = [row for row in rows if row[0] not in saved_ids]
+
+        # 2. 其余的打开帖子页面找图
+        # 复用主程序同一个已登录的 Chrome (CDP)，不再另起 persistent context
+        # 多个 tab 并行领任务，同一域名按间隔限速；卡死/崩溃的 tab 自动换新
+        pool = TabPool(session, size=BACKFILL_TABS, interval=BACKFILL_INTERVAL, init_script=STEALTH_JS)
+
+        async def worker(page, row):
+            post_id, url, _ = row
             platform = "x" if post_id.startswith("x_") else "wb"
-            local_path = await process_page(page, url, post_id, platform)
-
-            if local_path:
-                print(f"    ✅ Saved.")
-                conn.execute("UPDATE processed_posts SET image_path = ? WHERE post_id = ?", (local_path, post_id))
-                conn.commit()
-                updated_count += 1
-            else:
-                print(f"    ⚠️ No image captured.")
-
-            # [重要] 循环间的随机等待
-            await asyncio.sleep(random.uniform(1.0, 2.0))
-
-        await context.close()
+            return await process_page(page, url, post_id, platform, store)
+
+        total = finished + len(rows)
+        async for (post_id, url, attempts), result in pool.run(rows, worker, url_of=lambda row: row[1]):
+            outcome, local_path = result or (FAILED, None)
+            finish(post_id, outcome, attempts, local_path, total)
+    finally:
+        if batch:
+            record_attempts(conn, batch)
+        # pool 只关掉自己开的 tab
+        await session.close()
+        conn.close()
 
-    conn.close()
-    print(f"\n[Done] Backfill complete. Updated {updated_count} records.")
+    print(f"\n[Done] Backfill complete. Saved {counts[SAVED]}, text-only {counts[NO_IMAGE]}, "
+          f"failed {counts[FAILED]}.")
 
 
 if __name__ == "__main__":
-    asyncio.run(run_backfill())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Backfill missing images for X / Weibo posts.")
+    parser.add_argument("--reset-cache", action="store_true", help="忽略之前的纯文字/放弃记录，全部重新尝试")
+    args = parser.parse_args()
+    asyncio.run(run_backfill(reset_cache=args.reset_cache))
\ No newline at end of file
@@ -0,0 +1,369 @@
+import os
+import time
+import random
+import asyncio
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+from playwright.async_api import async_playwright
+
+CDP_URL = "http://127.0.0.1:9222"
+
+# 滚动: 等新内容的最长时间 (秒) / 连续几轮没有新内容就停 / 单次采集最多滚几轮
+SCROLL_MAX_WAIT = float(os.getenv("SMTF_SCROLL_MAX_WAIT", "6"))
+SCROLL_IDLE_ROUNDS = int(os.getenv("SMTF_SCROLL_IDLE_ROUNDS", "2"))
+SCROLL_MAX_ROUNDS = int(os.getenv("SMTF_SCROLL_MAX_ROUNDS", "30"))
+
+# 在页面里挂一个 MutationObserver，统计新插入的帖子节点数
+WATCH_NEW_ITEMS_JS = """
+(selector) => {
+    if (window.__smtfObserver) window.__smtfObserver.disconnect();
+    window.__smtfNew = 0;
+    window.__smtfObserver = new MutationObserver(mutations => {
+        for (const m of mutations) {
+            for (const node of m.addedNodes) {
+                if (node.nodeType === 1 && (node.matches(selector) || node.querySelector(selector))) {
+                    window.__smtfNew++;
+                }
+            }
+        }
+    });
+    window.__smtfObserver.observe(document.body, {childList: true, subtree: true});
+}
+"""
+
+
+class BrowserSession:
+    """
+    共享的 CDP 会话管理器。
+    整个进程只启动一个 Playwright driver、只连一次本地 Chrome，
+    各个 Harvester 按域名从标签页池里取 tab，采集结束后不断开，下次直接复用。
+    """
+
+    def __init__(self, cdp_url=CDP_URL):
+        self.cdp_url = cdp_url
+        self._playwright = None
+        self.browser = None
+        self.context = None
+        self._pages = {}       # key -> Page
+        self._logged_in = set()  # 已确认登录的 key
+        self._lock = asyncio.Lock()
+
+    @property
+    def connected(self):
+        return self.browser is not None and self.browser.is_connected()
+
+    async def connect(self):
+        """建立 (或复用) CDP 连接，返回默认 context"""
+        async with self._lock:
+            if self.connected:
+                return self.context
+
+            # 断线重连: 旧的 tab 引用全部作废
+            self._pages.clear()
+            self._logged_in.clear()
+
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+
+            print(f"[*] [Session] Connecting to LOCAL Chrome ({self.cdp_url})...")
+            self.browser = await self._playwright.chromium.connect_over_cdp(self.cdp_url)
+            self.context = self.browser.contexts[0]
+            return self.context
+
+    async def get_page(self, key, domains, start_url):
+        """
+        按域名取标签页: 池里有就直接用，否则扫描现有 tab，最后才新开。
+        :param key: 池中的名字 (例如 "x")
+        :param domains: 认为属于该站点的域名列表
+        :param start_url: 新开 tab 时访问的地址
+        """
+        context = await self.connect()
+
+        page = self._pages.get(key)
+        if page and not page.is_closed():
+            return page
+
+        page = None
+        for p_tab in context.pages:
+            if any(d in p_tab.url for d in domains):
+                page = p_tab
+                print(f"    -> [Session] Found existing {key} tab, reusing...")
+                break
+
+        if not page:
+            print(f"    -> [Session] No {key} tab found, opening new one...")
+            page = await context.new_page()
+            await page.goto(start_url)
+
+        self._pages[key] = page
+        return page
+
+    async def new_page(self):
+        """在已登录的 context 里开一个临时 tab (调用方负责关闭)"""
+        context = await self.connect()
+        return await context.new_page()
+
+    async def ensure_login(self, key, page, selector, timeout=8000):
+        """
+        登录检查每个站点只做一次。
+        selector 出现即视为已登录；否则一直等用户在浏览器里手动登录。
+        """
+        if key in self._logged_in:
+            return True
+        try:
+            await page.wait_for_selector(selector, timeout=timeout)
+        except Exception:
+            print(f"    [!] [{key}] Waiting for login...")
+            try:
+                await page.wait_for_selector(selector, timeout=0)
+            except Exception:
+                return False
+        self._logged_in.add(key)
+        return True
+
+    async def close(self):
+        """只断开连接，Chrome 依然在后台运行"""
+        if self.browser is not None:
+            try:
+                await self.browser.close()
+            except Exception:
+                pass
+            self.browser = None
+            self.context = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+        self._pages.clear()
+        self._logged_in.clear()
+        print("    -> [Session] Disconnected (Chrome stays open).")
+
+
+class DomainPacer:
+    """
+    对同一站点的请求限速: 最多 concurrency 个并发，相邻两次请求的发起间隔不少于 interval 秒。
+    用法: async with pacer.slot(): ...
+    """
+
+    def __init__(self, interval=0.5, concurrency=4):
+        self.interval = interval
+        self.concurrency = concurrency
+        self._semaphore = None
+        self._lock = None
+        self._next_at = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        # 信号量/锁要在运行中的事件循环里创建
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._lock = asyncio.Lock()
+        async with self._semaphore:
+            async with self._lock:
+                now = time.monotonic()
+                wait = self._next_at - now
+                self._next_at = max(now, self._next_at) + self.interval
+            if wait > 0:
+                await asyncio.sleep(wait)
+            yield
+
+
+class TabPool:
+    """
+    多 tab 工作池: size 个标签页共享已登录的 context，从队列里领任务。
+    - 按域名限速 (每个域名一个 DomainPacer)
+    - 任务超时或 tab 崩溃/被关掉时，关掉这个 tab 换一个新的，任务重新排队 (最多 retries 次)
+    用法:
+        async for item, result in pool.run(items, worker, url_of=...):
+            ...
+    worker(page, item) 返回结果；失败的任务结果为 None。
+    """
+
+    def __init__(self, session, size=4, interval=1.0, task_timeout=90, retries=1, init_script=None):
+        self.session = session
+        self.size = size
+        self.interval = interval
+        self.task_timeout = task_timeout
+        self.retries = retries
+        self.init_script = init_script
+        self._pacers = {}  # host -> DomainPacer
+        self._pages = []
+
+    def _pacer_for(self, url):
+        host = urlsplit(url).hostname or ""
+        if host not in self._pacers:
+            self._pacers[host] = DomainPacer(self.interval, self.size)
+        return self._pacers[host]
+
+    async def _open_tab(self):
+        page = await self.session.new_page()
+        if self.init_script:
+            await page.add_init_script(self.init_script)
+        self._pages.append(page)
+        return page
+
+    async def _recycle(self, page):
+        if page in self._pages:
+            self._pages.remove(page)
+        try:
+            if not page.is_closed():
+                await page.close()
+        except Exception:
+            pass
+        return await self._open_tab()
+
+    async def _worker(self, queue, results, worker, url_of):
+        page = await self._open_tab()
+        while True:
+            try:
+                item, attempt = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                # 只控制同一域名的发起间隔，并发数由 tab 数量决定
+                async with self._pacer_for(url_of(item)).slot():
+                    pass
+                result = await asyncio.wait_for(worker(page, item), self.task_timeout)
+                await results.put((item, result))
+            except Exception as e:
+                # 超时的 tab 可能卡死，崩溃的 tab 已经不能用: 一律换新
+                print(f"    [!] [TabPool] Task failed ({type(e).__name__}: {e}), recycling tab...")
+                page = await self._recycle(page)
+                if attempt < self.retries:
+                    queue.put_nowait((item, attempt + 1))
+                else:
+                    await results.put((item, None))
+
+    async def run(self, items, worker, url_of=lambda item: item):
+        queue = asyncio.Queue()
+        for item in items:
+            queue.put_nowait((item, 0))
+        if queue.empty():
+            return
+
+        results = asyncio.Queue()
+        workers = [asyncio.create_task(self._worker(queue, results, worker, url_of))
+                   for _ in range(min(self.size, queue.qsize()))]
+        done = asyncio.gather(*workers)
+        try:
+            while True:
+                getter = asyncio.ensure_future(results.get())
+                await asyncio.wait([getter, done], return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                    continue
+                getter.cancel()
+                # 所有 worker 都结束了: 把剩下的结果吐完
+                while not results.empty():
+                    yield results.get_nowait()
+                done.result()  # worker 自身的异常 (例如开 tab 失败) 在这里抛出
+                break
+        finally:
+            for task in workers:
+                task.cancel()
+            await self.close()
+
+    async def close(self):
+        """关掉池里开的 tab (不影响用户自己的标签页)"""
+        pages, self._pages = self._pages, []
+        for page in pages:
+            try:
+                if not page.is_closed():
+                    await page.close()
+            except Exception:
+                pass
+
+
+class ScrollDriver:
+    """
+    事件驱动的滚动: 每次滚动后等到真的有新帖子节点插入 (MutationObserver) 才进入下一轮，
+    最多等 max_wait 秒；连续 idle_rounds 轮没有新内容就认为 feed 到底了。
+    用法:
+        async for round_no in ScrollDriver(page, '[data-testid="tweet"]').rounds():
+            ...提取...
+            if 够了: break
+    第 0 轮不滚动，直接处理当前已经渲染的内容。
+    """
+
+    def __init__(self, page, item_selector, step=None, max_wait=SCROLL_MAX_WAIT,
+                 idle_rounds=SCROLL_IDLE_ROUNDS, max_rounds=SCROLL_MAX_ROUNDS, settle=0.3):
+        """
+        :param step: 滚动方式。None = 直接滚到底；int = 鼠标滚轮像素；(lo, hi) = 随机像素
+        :param settle: 检测到新节点后再等一小会儿，让同一批内容渲染完
+        """
+        self.page = page
+        self.item_selector = item_selector
+        self.step = step
+        self.max_wait = max_wait
+        self.idle_rounds = idle_rounds
+        self.max_rounds = max_rounds
+        self.settle = settle
+
+    async def _scroll(self):
+        if self.step is None:
+            await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        elif isinstance(self.step, tuple):
+            await self.page.mouse.wheel(0, random.randint(*self.step))
+        else:
+            await self.page.mouse.wheel(0, self.step)
+
+    async def _wait_for_new_items(self):
+        try:
+            # 按固定间隔轮询: 默认的 requestAnimationFrame 在后台 tab 里不会执行，
+            # 多平台并行 / TabPool 的 tab 都在后台，会一直等到超时被当成"没有新内容"
+            await self.page.wait_for_function("() => window.__smtfNew > 0", polling=100,
+                                              timeout=self.max_wait * 1000)
+            return True
+        except Exception:
+            return False
+
+    async def rounds(self):
+        await self.page.evaluate(WATCH_NEW_ITEMS_JS, self.item_selector)
+        yield 0
+
+        idle = 0
+        for round_no in range(1, self.max_rounds):
+            await self.page.evaluate("window.__smtfNew = 0")
+            await self._scroll()
+            if not await self._wait_for_new_items():
+                idle += 1
+                if idle >= self.idle_rounds:
+                    print(f"       (Feed exhausted after {round_no} scrolls)")
+                    return
+                continue
+            idle = 0
+            await asyncio.sleep(self.settle)
+            yield round_no
+
+
+class SessionClient:
+    """
+    Harvester 的会话接入点: 优先使用外部传入的共享 session，
+    单独运行 (python harvester.py) 时才自己创建并负责断开。
+    """
+    session = None
+    _owns_session = False
+
+    def _get_session(self):
+        if self.session is None:
+            self.session = BrowserSession()
+            self._owns_session = True
+        return self.session
+
+    async def close(self):
+        """只有自己创建的 session 才由自己断开"""
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+            self._owns_session = False
+
+    def stream(self, max_posts=5, known_ids=None, cursors=None):
+        """
+        边抓边吐: 每提取完一条就 yield 出去，调用方无需等整轮结束 (异步生成器，由各平台实现)。
+        known_ids: 已入库的 ID 集合，命中的帖子直接跳过。
+        cursors: HarvestCursors (watermark.py)，追上上次的进度就停止滚动。
+        """
+        raise NotImplementedError
+
+    async def harvest(self, max_posts=5, known_ids=None, cursors=None):
+        """一次性收集 stream() 的全部结果 (单独运行 / 调试用)"""
+        return [post async for post in self.stream(max_posts, known_ids, cursors)]
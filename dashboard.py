@@ -1,10 +1,13 @@
 import streamlit as st
 import sqlite3
 import pandas as pd
-from datetime import datetime, timedelta, date
+from datetime import datetime, timedelta, date, time
 import os
 import hashlib
+import threading
 from logic.filter import ContentFilter
+from logic.image_prep import thumbnail
+from database import Database, to_epoch, search_posts, query_posts, load_summaries, FTS_MIN_TERM, SEARCH_LIMIT
 
 st.set_page_config(page_title="SMTF Command Center", page_icon="🕵️", layout="wide")
 
@@ -19,21 +22,99 @@ def get_connection():
     return conn
 
 
-def load_data(start_date, end_date):
-    conn = get_connection()
-    s_str = f"{start_date} 00:00:00"
-    e_str = f"{end_date} 23:59:59"
-
-    # [关键] 确保选择了 image_path, url, verdict, manual_verdict
-    query = f"""
-        SELECT post_id, original_text, verdict, manual_verdict, summary, url, image_path, processed_at 
-        FROM processed_posts
-        WHERE processed_at BETWEEN '{s_str}' AND '{e_str}'
-        ORDER BY processed_at DESC
+@st.cache_resource
+def ensure_schema():
+    """打开一次 Database 触发 schema 迁移 (最新版本只读一次 user_version)"""
+    Database(DB_NAME).close()
+    return True
+
+
+@st.cache_resource
+def get_reader():
     """
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
+    只读查询共用一个长连接 (多个会话在不同线程里跑，用锁串行)。
+    PRAGMA data_version 只有在同一个连接上反复读才能看出别的连接有没有提交过。
+    """
+    conn = sqlite3.connect(DB_NAME, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    return conn, threading.Lock()
+
+
+def data_version():
+    """采集端 / 编辑每提交一次就会变，作为缓存 key 的一部分: 数据没变时 rerun 直接命中缓存"""
+    conn, lock = get_reader()
+    with lock:
+        return conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+LIST_COLUMNS = ["post_id", "platform", "verdict", "manual_verdict", "final_verdict", "url", "image_path",
+                "processed_at", "processed_ts", "original_text"]
+PAGE_SIZES = [20, 50, 100]
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def load_posts(start_date, end_date, platforms, verdicts, search_q, version):
+    """
+    日期 / 平台 / 状态 / 关键词全部下推到 SQL (关键词走 FTS5，按相关度排序 + 高亮)，不读 summary。
+    version 只用于让缓存在数据变化后失效。
+    """
+    columns = LIST_COLUMNS + (["highlighted", "rank"] if search_q else [])
+    if not platforms or not verdicts:
+        return pd.DataFrame(columns=columns)
+
+    # 整数时间戳 + 索引做范围查询，参数化避免拼接字符串
+    s_ts = to_epoch(datetime.combine(start_date, time.min))
+    e_ts = to_epoch(datetime.combine(end_date, time.max))
+    conn, lock = get_reader()
+    with lock:
+        if search_q:
+            # 多取一条，用来判断结果有没有被 SEARCH_LIMIT 截断
+            rows = search_posts(conn, search_q, start_ts=s_ts, end_ts=e_ts,
+                                platforms=list(platforms), verdicts=list(verdicts), limit=SEARCH_LIMIT + 1)
+        else:
+            rows = query_posts(conn, start_ts=s_ts, end_ts=e_ts,
+                               platforms=list(platforms), verdicts=list(verdicts))
+    return pd.DataFrame(rows, columns=columns)
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def load_page(start_date, end_date, platforms, verdicts, before, page_size, version):
+    """
+    Records 列表的一页 (keyset 分页: 从 before=(processed_ts, post_id) 之后开始取)。
+    多取一条用来判断还有没有下一页。
+    """
+    if not platforms or not verdicts:
+        return pd.DataFrame(columns=LIST_COLUMNS)
+    s_ts = to_epoch(datetime.combine(start_date, time.min))
+    e_ts = to_epoch(datetime.combine(end_date, time.max))
+    conn, lock = get_reader()
+    with lock:
+        rows = query_posts(conn, start_ts=s_ts, end_ts=e_ts, platforms=list(platforms), verdicts=list(verdicts),
+                           limit=page_size + 1, before=before)
+    return pd.DataFrame(rows, columns=LIST_COLUMNS)
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def load_post_summaries(post_ids, version):
+    """AI Notes 单独按 ID 取，列表查询不带长文本"""
+    conn, lock = get_reader()
+    with lock:
+        return load_summaries(conn, post_ids)
+
+
+@st.cache_data(show_spinner=False, max_entries=512)
+def load_thumbnail(image_path):
+    """列表里只放缩略图 (仓库里的路径按内容寻址，不会变，可以一直缓存)"""
+    return thumbnail(image_path)
+
+
+def next_page(cursor):
+    st.session_state.page_cursors.append(cursor)
+
+
+def prev_page():
+    if len(st.session_state.page_cursors) > 1:
+        st.session_state.page_cursors.pop()
 
 
 def update_manual_verdict(post_id, new_verdict):
@@ -44,6 +125,8 @@ def update_manual_verdict(post_id, new_verdict):
     )
     conn.commit()
     conn.close()
+    # data_version 也会变，这里顺手清掉旧结果，不让它们占着缓存
+    load_posts.clear()
     st.rerun()
 
 
@@ -98,38 +181,31 @@ with st.sidebar:
     sel_verdicts = st.multiselect("Verdict", all_verdicts, default=["TRUE", "FALSE", "MIXED"])
 
     search_q = st.text_input("Search Keyword", "")
+    if any(len(t) < FTS_MIN_TERM for t in search_q.split()):
+        # trigram 索引至少要 3 个字符，两个字的中文词只能逐行 LIKE 扫描 (仍限定在所选日期范围内)
+        st.caption(f"⚠️ Terms shorter than {FTS_MIN_TERM} characters can't use the search index; "
+                   f"falling back to a slower full scan of the selected date range.")
+
+    page_size = st.selectbox("Page size", PAGE_SIZES, index=0)
 
     if st.button("Clear Chat History"):
         st.session_state.messages = []
         st.rerun()
 
-# Load & Process Data
+# Load Data (筛选全部在 SQL 里完成，数据没变时直接命中缓存)
 if os.path.exists(DB_NAME):
-    df = load_data(start_date, end_date)
+    ensure_schema()
+    version = data_version()
+    filtered_df = load_posts(start_date, end_date, tuple(sel_platforms), tuple(sel_verdicts), search_q, version)
 else:
     st.error("Database not found!")
     st.stop()
 
-# 计算最终状态 (人工覆盖 AI)
-df['final_verdict'] = df['manual_verdict'].combine_first(df['verdict'])
-
-
-# 平台标签处理
-def get_platform_label(pid):
-    pid = str(pid)
-    if pid.startswith("x_"): return "x"
-    if pid.startswith("reddit_"): return "reddit"
-    if pid.startswith("wb_"): return "wb"
-    return "unknown"
-
-
-df['platform'] = df['post_id'].apply(get_platform_label)
-
-# --- Apply Filters ---
-filtered_df = df[df['platform'].isin(sel_platforms)]
-filtered_df = filtered_df[filtered_df['final_verdict'].isin(sel_verdicts)]
-if search_q:
-    filtered_df = filtered_df[filtered_df['original_text'].str.contains(search_q, case=False)]
+# 关键词检索只保留相关度最高的 SEARCH_LIMIT 条: 多出来的那条说明有结果被截掉，简报 / 对话看到的也只是这部分
+search_truncated = bool(search_q) and len(filtered_df) > SEARCH_LIMIT
+filtered_df = filtered_df.iloc[:SEARCH_LIMIT] if search_truncated else filtered_df
+truncation_note = (f"Showing only the first {SEARCH_LIMIT} search matches (best first); "
+                   f"more records match '{search_q}'. Narrow the filters to see the rest.")
 
 # ==========================================
 # 2. Main Layout (Tabs)
@@ -148,6 +224,9 @@ with tab1:
     search_hash = hashlib.md5(search_q.encode()).hexdigest()[:6] if search_q else "nosearch"
     report_key = f"report_{start_date}_{end_date}_{platforms_hash}_{verdicts_hash}_{search_hash}"
 
+    if search_truncated:
+        st.warning(f"⚠️ {truncation_note} The briefing only covers these {SEARCH_LIMIT}.")
+
     if not filtered_df.empty:
         ids_str = "".join(sorted(filtered_df['post_id'].astype(str).tolist()))
         current_hash = hashlib.md5(ids_str.encode()).hexdigest()
@@ -169,6 +248,9 @@ with tab1:
                         status = r['final_verdict']
                         url = r['url'] or 'N/A'
                         texts.append(f"[{status}] [{r['platform']}] {r['original_text']} (Src: {url})")
+                    if search_truncated:
+                        # 让 AI 知道这不是全部匹配结果，别当成完整统计
+                        texts.insert(0, f"NOTE: {truncation_note}")
 
                     summary = ContentFilter().generate_daily_briefing(texts)
                     save_briefing(report_key, summary, current_hash)
@@ -186,9 +268,29 @@ with tab1:
     st.divider()
 
     # B. List Section
-    st.markdown(f"### 🔍 Records ({len(filtered_df)})")
+    st.markdown(f"### 🔍 Records ({len(filtered_df)}{'+' if search_truncated else ''})")
+    if search_truncated:
+        st.caption(f"⚠️ {truncation_note}")
+
+    # 分页: 每页只渲染 page_size 条，渲染开销和日期范围大小无关
+    # page_cursors[i] 是第 i 页的起点 (上一页最后一条的 (processed_ts, post_id))，筛选条件变了就回到第一页
+    page_filter = (start_date, end_date, tuple(sel_platforms), tuple(sel_verdicts), search_q, page_size)
+    if st.session_state.get("page_filter") != page_filter:
+        st.session_state.page_filter = page_filter
+        st.session_state.page_cursors = [None]
+    page_no = len(st.session_state.page_cursors) - 1
+
+    if search_q:
+        # 检索结果按相关度排序 (最多 SEARCH_LIMIT 条)，没有时间顺序可言，直接在缓存的结果里切片
+        page_df = filtered_df.iloc[page_no * page_size:(page_no + 1) * page_size]
+        has_next = len(filtered_df) > (page_no + 1) * page_size
+    else:
+        page_df = load_page(start_date, end_date, tuple(sel_platforms), tuple(sel_verdicts),
+                            st.session_state.page_cursors[-1], page_size, version)
+        has_next = len(page_df) > page_size
+        page_df = page_df.iloc[:page_size]
 
-    for index, row in filtered_df.iterrows():
+    for index, row in page_df.iterrows():
         with st.container(border=True):
             c1, c2 = st.columns([5, 1])
             with c1:
@@ -199,20 +301,24 @@ with tab1:
                 st.markdown(f"**{p_label}** | `{row['processed_at']}` | 🆔 `{row['post_id']}`")
 
                 # 正文 (带链接)
-                txt = row['original_text'].replace('\n', '  \n')
+                txt = row.get('highlighted') or row['original_text']
+                txt = txt.replace('\n', '  \n')
                 if row['url']:
                     st.markdown(f"[{txt}]({row['url']})")
                 else:
                     st.markdown(txt)
 
-                # --- 多模态图片显示 ---
+                # --- 多模态图片显示 (缩略图) ---
                 if row['image_path'] and os.path.exists(row['image_path']):
-                    st.image(row['image_path'], caption="Snapshot", width=400)
+                    thumb = load_thumbnail(row['image_path'])
+                    if thumb:
+                        st.image(thumb, caption="Snapshot", width=240)
                 # --------------------
 
-                if row['summary']:
-                    with st.expander("AI Notes"):
-                        st.markdown(row['summary'])
+                # AI Notes 打开时才去库里取 summary
+                if st.toggle("AI Notes", key=f"n_{row['post_id']}"):
+                    summary = load_post_summaries((row['post_id'],), version).get(row['post_id'])
+                    st.markdown(summary or "_No notes._")
 
             with c2:
                 # [更新] 状态颜色逻辑
@@ -235,10 +341,24 @@ with tab1:
                     if new_v != row['manual_verdict']:
                         update_manual_verdict(row['post_id'], new_v)
 
+    if page_no > 0 or has_next:
+        col_prev, col_page, col_next = st.columns([1, 4, 1])
+        with col_prev:
+            st.button("◀ Prev", on_click=prev_page, disabled=page_no == 0, key="page_prev")
+        with col_page:
+            st.caption(f"Page {page_no + 1} · {page_size} per page")
+        with col_next:
+            if not page_df.empty:
+                last = page_df.iloc[-1]
+                st.button("Next ▶", on_click=next_page, args=((int(last['processed_ts']), last['post_id']),),
+                          disabled=not has_next, key="page_next")
+
 # --- TAB 2: Chat Interface ---
 with tab2:
     st.header("💬 Ask the Intelligence Database")
     st.caption(f"Context: Analyzing {len(filtered_df)} filtered records from {start_date} to {end_date}")
+    if search_truncated:
+        st.warning(f"⚠️ {truncation_note}")
 
     if "messages" not in st.session_state:
         st.session_state.messages = []
@@ -257,6 +377,8 @@ with tab2:
             for _, r in filtered_df.iterrows():
                 context_list.append(
                     f"ID: {r['post_id']} | Status: {r['final_verdict']} | Platform: {r['platform']} | Content: {r['original_text']}")
+            if search_truncated:
+                context_list.insert(0, f"NOTE: {truncation_note}")
             context_data = "\n".join(context_list)
         else:
             context_data = "No data found matching current filters."
@@ -1,10 +1,319 @@
 import sqlite3
 import json
+import time
+import calendar
 from datetime import datetime
 
+# post_id 前缀 -> 平台
+PLATFORM_PREFIXES = (("x_", "x"), ("reddit_", "reddit"), ("wb_", "wb"))
+
+
+def platform_of(post_id) -> str:
+    pid = str(post_id)
+    for prefix, platform in PLATFORM_PREFIXES:
+        if pid.startswith(prefix):
+            return platform
+    return "unknown"
+
+
+# trigram 分词对中文 (微博) 友好，不依赖空格切词；最短可检索 3 个字符
+FTS_MIN_TERM = 3
+# 关键词检索最多返回多少条 (按相关度取前 N 条)，Dashboard 据此提示结果是否被截断
+SEARCH_LIMIT = 500
+
+
+def to_epoch(dt: datetime) -> int:
+    """
+    processed_ts 的换算: 本地时间按 UTC 计秒，
+    和 SQLite 的 strftime('%s', processed_at) 一致，方便直接用整数做范围查询。
+    """
+    return calendar.timegm(dt.timetuple())
+
+
+# ==========================================
+# Schema 迁移 (PRAGMA user_version 记录当前版本)
+# ==========================================
+# 取代手动运行的 migrate_v2/v3/v4.py: Database 打开时自动补齐。
+# 已是最新版本的库只需读一次 user_version。
+# 每一步都要能在"旧库可能已经手动迁移过一部分"的情况下安全重跑。
+
+BACKFILL_CHUNK = 5000
+
+
+def _columns(conn, table):
+    return [info[1] for info in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def _add_column(conn, table, column, col_type):
+    if column not in _columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}")
+
+
+def _m1_base(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS processed_posts (
+            post_id TEXT PRIMARY KEY,
+            original_text TEXT,
+            verdict TEXT,
+            summary TEXT,
+            processed_at TIMESTAMP
+        )
+    ''')
+
+
+def _m2_url_manual_verdict(conn):
+    # 原 migrate_v2.py
+    _add_column(conn, "processed_posts", "url", "TEXT")
+    _add_column(conn, "processed_posts", "manual_verdict", "TEXT")
+
+
+def _m3_briefings(conn):
+    # 原 migrate_v3.py: 简报存档表，context_hash 用来做缓存失效检测
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS briefings (
+            date_key TEXT PRIMARY KEY,
+            content TEXT,
+            context_hash TEXT,
+            created_at TIMESTAMP
+        )
+    ''')
+
+
+def _m4_image_path(conn):
+    # 原 migrate_v4.py
+    _add_column(conn, "processed_posts", "image_path", "TEXT")
+
+
+def _m5_platform_ts(conn):
+    """
+    平台列 + 整数时间戳，日期范围 + 平台/状态筛选都走索引:
+      - (processed_ts, post_id): 时间范围 + Dashboard 的 keyset 分页
+      - (platform, processed_ts)
+      - (COALESCE(manual_verdict, verdict), processed_ts): 按最终状态 (人工修正优先) 筛选，查询写法要和表达式一致
+    自行管理事务: 大表建索引要排序全表，每个索引一个短事务。
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    _add_column(conn, "processed_posts", "platform", "TEXT")
+    _add_column(conn, "processed_posts", "processed_ts", "INTEGER")
+    conn.execute("COMMIT")
+    for statement in (
+        "CREATE INDEX IF NOT EXISTS idx_posts_ts_id ON processed_posts(processed_ts, post_id)",
+        "CREATE INDEX IF NOT EXISTS idx_posts_platform_ts ON processed_posts(platform, processed_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_posts_final_verdict_ts "
+        "ON processed_posts(COALESCE(manual_verdict, verdict), processed_ts)",
+    ):
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(statement)
+        conn.execute("COMMIT")
+
+
+def _m6_backfill_platform_ts(conn):
+    """分块回填 platform / processed_ts，每块一个短事务，大表也不会长时间锁库"""
+    platform_case = " ".join(
+        f"WHEN post_id LIKE '{prefix}%' THEN '{platform}'" for prefix, platform in PLATFORM_PREFIXES
+    )
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        cur = conn.execute(f'''
+            UPDATE processed_posts SET
+                platform = COALESCE(platform, CASE {platform_case} ELSE 'unknown' END),
+                processed_ts = COALESCE(processed_ts, CAST(strftime('%s', processed_at) AS INTEGER), 0)
+            WHERE rowid IN (
+                SELECT rowid FROM processed_posts
+                WHERE platform IS NULL OR processed_ts IS NULL
+                LIMIT {BACKFILL_CHUNK}
+            )
+        ''')
+        conn.execute("COMMIT")
+        if cur.rowcount < BACKFILL_CHUNK:
+            break
+
+
+def _m7_search_index(conn):
+    """
+    FTS5 全文索引 (external content，靠触发器同步)。
+    processed_posts 的主键是 TEXT，隐式 rowid 在 VACUUM 后可能变，不能当索引键:
+    另建 post_keys (doc_id 是 INTEGER PRIMARY KEY，VACUUM 不会重排)，FTS 的内容表用按 doc_id 对齐的视图。
+    自行管理事务: post_keys 分块回填；触发器 + 一次 rebuild 放在最后一个短事务里。
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS post_keys (
+            doc_id INTEGER PRIMARY KEY,
+            post_id TEXT UNIQUE NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE VIEW IF NOT EXISTS posts_fts_source AS
+        SELECT k.doc_id, p.original_text, p.summary
+        FROM post_keys k JOIN processed_posts p ON p.post_id = k.post_id
+    ''')
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+                original_text, summary,
+                content='posts_fts_source', content_rowid='doc_id', tokenize='trigram'
+            )
+        ''')
+    except sqlite3.OperationalError:
+        # SQLite < 3.34 没有 trigram，退回 unicode61 (中文只能整句匹配)
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+                original_text, summary,
+                content='posts_fts_source', content_rowid='doc_id'
+            )
+        ''')
+    conn.execute("COMMIT")
+
+    # 已有帖子分配 doc_id: 每块一个短事务，中断后重跑从剩下的行继续
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        cur = conn.execute(f'''
+            INSERT INTO post_keys (post_id)
+            SELECT p.post_id FROM processed_posts p
+            WHERE NOT EXISTS (SELECT 1 FROM post_keys k WHERE k.post_id = p.post_id)
+            LIMIT {BACKFILL_CHUNK}
+        ''')
+        conn.execute("COMMIT")
+        if cur.rowcount < BACKFILL_CHUNK:
+            break
+
+    conn.execute("BEGIN IMMEDIATE")
+    # 分块期间新写入的帖子补上 doc_id，然后挂触发器、一次性建索引
+    conn.execute('''
+        INSERT OR IGNORE INTO post_keys (post_id) SELECT post_id FROM processed_posts
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS posts_fts_ai AFTER INSERT ON processed_posts BEGIN
+            INSERT OR IGNORE INTO post_keys (post_id) VALUES (new.post_id);
+            INSERT INTO posts_fts(rowid, original_text, summary)
+            VALUES ((SELECT doc_id FROM post_keys WHERE post_id = new.post_id), new.original_text, new.summary);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS posts_fts_ad AFTER DELETE ON processed_posts BEGIN
+            INSERT INTO posts_fts(posts_fts, rowid, original_text, summary)
+            VALUES ('delete', (SELECT doc_id FROM post_keys WHERE post_id = old.post_id),
+                    old.original_text, old.summary);
+            DELETE FROM post_keys WHERE post_id = old.post_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS posts_fts_au AFTER UPDATE OF original_text, summary ON processed_posts BEGIN
+            INSERT INTO posts_fts(posts_fts, rowid, original_text, summary)
+            VALUES ('delete', (SELECT doc_id FROM post_keys WHERE post_id = old.post_id),
+                    old.original_text, old.summary);
+            INSERT INTO posts_fts(rowid, original_text, summary)
+            VALUES ((SELECT doc_id FROM post_keys WHERE post_id = new.post_id), new.original_text, new.summary);
+        END
+    ''')
+    conn.execute("INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')")
+    conn.execute("COMMIT")
+
+
+def _m8_harvest_watermarks(conn):
+    # 每个来源 (x / reddit / wb:<uid>) 的增量采集水位，见 watermark.py
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS harvest_watermarks (
+            source TEXT PRIMARY KEY,
+            newest_id TEXT,
+            newest_ts INTEGER,
+            last_new_count INTEGER,
+            updated_at INTEGER
+        )
+    ''')
+
+
+def _m9_backfill_attempts(conn):
+    # 图片回填的尝试记录 (负缓存): 纯文字帖标记一次就不再访问，失败的按 retry_after 退避
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS backfill_attempts (
+            post_id TEXT PRIMARY KEY,
+            outcome TEXT,
+            attempts INTEGER DEFAULT 0,
+            last_attempt_ts INTEGER,
+            retry_after INTEGER
+        )
+    ''')
+
+
+def _m10_post_media(conn):
+    # 采集时记下的图片清单 (原图 URL / 尺寸 / 类型)，回填时直接按 URL 下载，不用再打开页面
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS post_media (
+            post_id TEXT,
+            position INTEGER,
+            url TEXT,
+            width INTEGER,
+            height INTEGER,
+            content_type TEXT,
+            PRIMARY KEY (post_id, position)
+        )
+    ''')
+
+
+# (版本号, 说明, 函数, 是否自行分块提交)
+MIGRATIONS = [
+    (1, "processed_posts base table", _m1_base, False),
+    (2, "url / manual_verdict columns", _m2_url_manual_verdict, False),
+    (3, "briefings table", _m3_briefings, False),
+    (4, "image_path column", _m4_image_path, False),
+    (5, "platform / processed_ts columns + indexes", _m5_platform_ts, True),
+    (6, "backfill platform / processed_ts", _m6_backfill_platform_ts, True),
+    (7, "FTS5 search index", _m7_search_index, True),
+    (8, "harvest_watermarks table", _m8_harvest_watermarks, False),
+    (9, "backfill_attempts table", _m9_backfill_attempts, False),
+    (10, "post_media table", _m10_post_media, False),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def migrate(conn) -> int:
+    """
+    把数据库升级到 SCHEMA_VERSION，返回升级后的版本号。
+    连续的普通步骤放在同一个事务里 (要么全成要么全回滚)；
+    分块回填类步骤自己管理短事务，中断后重跑会从剩下的行继续。
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return version
+
+    pending = [m for m in MIGRATIONS if m[0] > version]
+    print(f"    [DB] Migrating schema v{version} -> v{SCHEMA_VERSION}...")
+
+    # 手动控制事务 (sqlite3 模块默认的隐式事务会和 DDL / 分块提交打架)
+    old_isolation = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        in_tx = False
+        for number, description, step, chunked in pending:
+            if chunked:
+                if in_tx:
+                    conn.execute("COMMIT")
+                    in_tx = False
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {number}")
+            else:
+                if not in_tx:
+                    conn.execute("BEGIN IMMEDIATE")
+                    in_tx = True
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {number}")
+            print(f"       v{number}: {description}")
+        if in_tx:
+            conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.isolation_level = old_isolation
+
+    return SCHEMA_VERSION
+
 
 class Database:
-    def __init__(self, db_name="smtf_memory.db"):
+    def __init__(self, db_name="smtf_memory.db", batch_size=50, flush_interval=5.0):
         # [核心修改] 增加 timeout=30 (单位：秒)
         # 这意味着如果数据库被占用，它会耐心等待30秒，而不是立刻崩溃
         self.conn = sqlite3.connect(db_name, timeout=30.0)
@@ -13,29 +322,33 @@ class Database:
         self.cursor = self.conn.cursor()
         self._init_db()
 
+        # queue_result 的攒批参数: 满 batch_size 条或超过 flush_interval 秒提交一次
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending_results = []
+        self._last_flush = time.monotonic()
+
     def _init_db(self):
-        """初始化数据表"""
-        # 包含所有 V4 版本的字段
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS processed_posts (
-                post_id TEXT PRIMARY KEY,
-                original_text TEXT,
-                verdict TEXT,
-                summary TEXT,
-                processed_at TIMESTAMP,
-                url TEXT,
-                manual_verdict TEXT,
-                image_path TEXT
-            )
-        ''')
+        """初始化 / 升级数据表 (见 MIGRATIONS)"""
+        migrate(self.conn)
+
+    def rebuild_search_index(self):
+        """按 processed_posts 重建全文索引 (索引键是稳定的 post_keys.doc_id，VACUUM 之后也不需要；只用于手动修复)"""
+        self.cursor.execute("INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')")
         self.conn.commit()
 
     def is_processed(self, post_id_hash) -> bool:
         self.cursor.execute('SELECT 1 FROM processed_posts WHERE post_id = ?', (str(post_id_hash),))
         return self.cursor.fetchone() is not None
 
-    def save_result(self, post_data: dict, analysis_result: dict):
-        """保存处理结果 (适配 V3.3 三态逻辑)"""
+    def load_processed_ids(self) -> set:
+        """一次性读出全部已处理 ID，供采集端在内存里做"见过没"的判断 (只走主键索引)"""
+        self.cursor.execute('SELECT post_id FROM processed_posts')
+        return {row[0] for row in self.cursor.fetchall()}
+
+    @staticmethod
+    def _result_row(post_data: dict, analysis_result: dict) -> tuple:
+        """把 (帖子, 分析结果) 转成 processed_posts 的一行 (适配 V3.3 三态逻辑)"""
 
         # [核心修改] 直接从 analysis_result 获取 verdict
         # 如果是 Stage 1 过滤掉的，通常 verdict 是 NOISE
@@ -51,23 +364,138 @@ class Database:
         # summary 对应 filter 返回的 summary (原 fact_check_notes)
         summary = analysis_result.get('summary', 'No summary')
 
+        post_id = str(post_data['id'])
+        now = datetime.now()
+        return (
+            post_id,
+            post_data['text'],
+            verdict,
+            summary,
+            now,
+            post_url,
+            img_path,
+            platform_of(post_id),
+            to_epoch(now)
+        )
+
+    @staticmethod
+    def _media_rows(post_data: dict) -> list:
+        """帖子的图片清单 (post["media"]，见 media.manifest_entry) -> post_media 的行"""
+        post_id = str(post_data['id'])
+        return [
+            (post_id, i, m.get('url'), m.get('width', 0), m.get('height', 0), m.get('content_type'))
+            for i, m in enumerate(post_data.get('media') or []) if m.get('url')
+        ]
+
+    def _save_media(self, media_rows):
+        self.conn.executemany('''
+            INSERT OR REPLACE INTO post_media (post_id, position, url, width, height, content_type)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', media_rows)
+
+    def save_result(self, post_data: dict, analysis_result: dict):
+        """保存单条处理结果 (已存在则跳过)"""
+        row = self._result_row(post_data, analysis_result)
         try:
             self.cursor.execute('''
-                INSERT INTO processed_posts (post_id, original_text, verdict, summary, processed_at, url, image_path)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                str(post_data['id']),
-                post_data['text'],
-                verdict,
-                summary,
-                datetime.now(),
-                post_url,
-                img_path
-            ))
+                INSERT INTO processed_posts (post_id, original_text, verdict, summary, processed_at, url, image_path,
+                                             platform, processed_ts)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', row)
+            self._save_media(self._media_rows(post_data))
             self.conn.commit()
-            print(f"    [DB] Saved {str(post_data['id'])[:8]} as {verdict}")
+            print(f"    [DB] Saved {row[0][:8]} as {row[2]}")
         except sqlite3.IntegrityError:
-            print(f"    [DB] Post {str(post_data['id'])[:8]} already exists.")
+            print(f"    [DB] Post {row[0][:8]} already exists.")
+
+    def save_results(self, items) -> int:
+        """
+        批量写入 [(post_data, analysis_result), ...]: executemany + 单个事务 (一次 fsync)。
+        已存在的帖子按 upsert 更新分析结果，保留原 processed_at 和人工修正 (manual_verdict)。
+        """
+        items = list(items)
+        rows = [self._result_row(post, analysis) for post, analysis in items]
+        if not rows:
+            return 0
+        with self.conn:
+            self.conn.executemany('''
+                INSERT INTO processed_posts (post_id, original_text, verdict, summary, processed_at, url, image_path,
+                                             platform, processed_ts)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(post_id) DO UPDATE SET
+                    original_text = excluded.original_text,
+                    verdict = excluded.verdict,
+                    summary = excluded.summary,
+                    url = COALESCE(NULLIF(excluded.url, ''), processed_posts.url),
+                    image_path = COALESCE(excluded.image_path, processed_posts.image_path)
+            ''', rows)
+            self._save_media([m for post, _ in items for m in self._media_rows(post)])
+        print(f"    [DB] Saved batch of {len(rows)} posts.")
+        return len(rows)
+
+    def queue_result(self, post_data: dict, analysis_result: dict):
+        """
+        攒批版 save_result: 先放内存，满一批或超过时间窗口再一次性提交。
+        长时间运行时配合定时调用 flush_if_due()；结束时记得 flush() (close() 会自动 flush)。
+        """
+        self._pending_results.append((post_data, analysis_result))
+        if (len(self._pending_results) >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush_if_due(self):
+        """定时器调用: 有积压且超过时间窗口就提交，不必等下一次 queue_result"""
+        if self._pending_results and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        pending, self._pending_results = self._pending_results, []
+        self._last_flush = time.monotonic()
+        if pending:
+            self.save_results(pending)
+
+    def update_analyses(self, updates, clear_manual=False) -> int:
+        """
+        批量更新已有帖子的分析结果: updates = [(post_id, verdict, summary), ...]，一个事务提交。
+        clear_manual=True 时顺便清空人工修正，让 Dashboard 显示最新的 AI 结果。
+        """
+        rows = [(verdict, summary, str(post_id)) for post_id, verdict, summary in updates]
+        if not rows:
+            return 0
+        manual_clause = ", manual_verdict = NULL" if clear_manual else ""
+        with self.conn:
+            self.conn.executemany(f'''
+                UPDATE processed_posts
+                SET verdict = ?, summary = ?{manual_clause}
+                WHERE post_id = ?
+            ''', rows)
+        return len(rows)
+
+    def load_watermarks(self) -> dict:
+        """source -> {newest_id, newest_ts, last_new_count, updated_at}"""
+        self.cursor.execute(
+            'SELECT source, newest_id, newest_ts, last_new_count, updated_at FROM harvest_watermarks'
+        )
+        return {
+            row[0]: {"newest_id": row[1], "newest_ts": row[2], "last_new_count": row[3], "updated_at": row[4]}
+            for row in self.cursor.fetchall()
+        }
+
+    def set_watermark(self, source, newest_id, newest_ts, new_count=0):
+        with self.conn:
+            self.conn.execute('''
+                INSERT INTO harvest_watermarks (source, newest_id, newest_ts, last_new_count, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(source) DO UPDATE SET
+                    newest_id = excluded.newest_id,
+                    newest_ts = excluded.newest_ts,
+                    last_new_count = excluded.last_new_count,
+                    updated_at = excluded.updated_at
+            ''', (source, newest_id, newest_ts, new_count, int(time.time())))
+
+    def search(self, query, start_ts=None, end_ts=None, platforms=None, limit=500):
+        """全文检索 original_text + summary，按相关度排序并带高亮，见 search_posts()"""
+        return search_posts(self.conn, query, start_ts, end_ts, platforms, limit)
 
     def get_recent_digests(self, limit=10):
         # 这是一个给旧版 Editor 用的接口，Dashboard 现在直接读 pandas
@@ -75,10 +503,140 @@ class Database:
             SELECT original_text, verdict, summary, processed_at 
             FROM processed_posts 
             WHERE verdict != 'NOISE' 
-            ORDER BY processed_at DESC 
+            ORDER BY processed_ts DESC 
             LIMIT ?
         ''', (limit,))
         return self.cursor.fetchall()
 
     def close(self):
-        self.conn.close()
\ No newline at end of file
+        self.flush()
+        self.conn.close()
+
+
+def load_media_manifest(conn, post_ids) -> dict:
+    """post_id -> 采集时记下的图片清单 [dict]，按帖子里的顺序"""
+    ids = list({str(i) for i in post_ids})
+    manifest = {}
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(f'''
+            SELECT post_id, url, width, height, content_type FROM post_media
+            WHERE post_id IN ({placeholders})
+            ORDER BY post_id, position
+        ''', chunk).fetchall()
+        for post_id, url, width, height, content_type in rows:
+            manifest.setdefault(post_id, []).append(
+                {"url": url, "width": width, "height": height, "content_type": content_type}
+            )
+    return manifest
+
+
+# 列表用的列: 不含 summary (长文本，展开时再按 ID 取)；final_verdict = 人工修正优先
+POST_LIST_COLUMNS = """p.post_id, p.platform, p.verdict, p.manual_verdict,
+                 COALESCE(p.manual_verdict, p.verdict) AS final_verdict, p.url, p.image_path,
+                 p.processed_at, p.processed_ts, p.original_text"""
+
+
+def _post_filters(start_ts=None, end_ts=None, platforms=None, verdicts=None):
+    """日期 / 平台 / 最终状态 -> (WHERE 条件列表, 参数)，全部参数化"""
+    filters, params = [], []
+    if start_ts is not None:
+        filters.append("p.processed_ts >= ?")
+        params.append(int(start_ts))
+    if end_ts is not None:
+        filters.append("p.processed_ts <= ?")
+        params.append(int(end_ts))
+    if platforms:
+        filters.append(f"p.platform IN ({','.join('?' * len(platforms))})")
+        params.extend(platforms)
+    if verdicts:
+        filters.append(f"COALESCE(p.manual_verdict, p.verdict) IN ({','.join('?' * len(verdicts))})")
+        params.extend(verdicts)
+    return filters, params
+
+
+def query_posts(conn, start_ts=None, end_ts=None, platforms=None, verdicts=None, limit=None, before=None):
+    """
+    Dashboard 列表查询: 所有筛选条件都在 SQL 里完成 (走 processed_ts 索引)，按时间倒序。
+    before=(processed_ts, post_id): keyset 分页，只取这条之后 (更旧) 的记录，翻到第几页都不用 OFFSET 扫描。
+    返回 [dict]，列见 POST_LIST_COLUMNS。
+    """
+    filters, params = _post_filters(start_ts, end_ts, platforms, verdicts)
+    if before is not None:
+        filters.append("(p.processed_ts, p.post_id) < (?, ?)")
+        params.extend([int(before[0]), str(before[1])])
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+    sql = f"""
+        SELECT {POST_LIST_COLUMNS}
+        FROM processed_posts p
+        {where}
+        ORDER BY p.processed_ts DESC, p.post_id DESC
+    """
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+    cur = conn.execute(sql, params)
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, row)) for row in cur.fetchall()]
+
+
+def load_summaries(conn, post_ids) -> dict:
+    """post_id -> summary，只取需要展示的那几条"""
+    ids = list({str(i) for i in post_ids})
+    summaries = {}
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        summaries.update(conn.execute(
+            f"SELECT post_id, summary FROM processed_posts WHERE post_id IN ({placeholders})", chunk
+        ).fetchall())
+    return summaries
+
+
+def search_posts(conn, query, start_ts=None, end_ts=None, platforms=None, limit=SEARCH_LIMIT, verdicts=None):
+    """
+    关键词检索 (Dashboard 和 Database.search 共用)。
+    返回 [dict]，按 bm25 相关度排序，highlighted 字段里命中部分用 ** 包裹 (Markdown 加粗)。
+    任何一个词短于 FTS_MIN_TERM 时 trigram 无法匹配，退回 LIKE 扫描 (仍受日期/平台/状态条件约束)。
+    """
+    terms = [t for t in str(query).split() if t]
+    if not terms:
+        return []
+
+    filters, params = _post_filters(start_ts, end_ts, platforms, verdicts)
+    columns = POST_LIST_COLUMNS
+
+    if all(len(t) >= FTS_MIN_TERM for t in terms):
+        # 每个词当短语处理并转义引号，避免用户输入触发 FTS 语法错误
+        match = " AND ".join('"' + t.replace('"', '""') + '"' for t in terms)
+        where = " AND ".join(["posts_fts MATCH ?"] + filters)
+        sql = f"""
+            SELECT {columns},
+                   highlight(posts_fts, 0, '**', '**') AS highlighted,
+                   bm25(posts_fts) AS rank
+            FROM posts_fts
+            JOIN post_keys k ON k.doc_id = posts_fts.rowid
+            JOIN processed_posts p ON p.post_id = k.post_id
+            WHERE {where}
+            ORDER BY rank
+            LIMIT ?
+        """
+        args = [match] + params + [limit]
+    else:
+        for t in terms:
+            filters.append("(p.original_text LIKE ? OR p.summary LIKE ?)")
+            params.extend([f"%{t}%", f"%{t}%"])
+        where = " AND ".join(filters)
+        sql = f"""
+            SELECT {columns}, p.original_text AS highlighted, 0.0 AS rank
+            FROM processed_posts p
+            WHERE {where}
+            ORDER BY p.processed_ts DESC
+            LIMIT ?
+        """
+        args = params + [limit]
+
+    cur = conn.execute(sql, args)
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, row)) for row in cur.fetchall()]
@@ -1,163 +1,348 @@
 import asyncio
-from playwright.async_api import async_playwright
 import os
-import random
 import re  # 别忘了导入 re
+from browser_session import SessionClient, ScrollDriver
+from image_store import ImageStore
+from media import MediaDownloader, manifest_entry, pop_finished, drain
 
+# 单次注入的提取脚本: 返回当前 DOM 里所有推文的 id / 链接 / 作者 / 正文 / 图片
+EXTRACT_TWEETS_JS = """
+() => Array.from(document.querySelectorAll('[data-testid="tweet"]')).map(el => {
+    let id = null, href = "";
+    for (const a of el.querySelectorAll('a[href*="/status/"]')) {
+        const h = a.getAttribute("href") || "";
+        const m = h.match(/\\/status\\/(\\d+)/);
+        if (m) { id = m[1]; href = h; break; }
+    }
+    const time = el.querySelector("time[datetime]");
+    // 页面上只有缩略图，原图尺寸未知 (清单里记 0x0)
+    const media = Array.from(el.querySelectorAll('[data-testid="tweetPhoto"] img')).map(img => ({
+        url: img.getAttribute("src")
+    }));
+    return {
+        id,
+        url: href ? "https://x.com" + href : "",
+        text: el.innerText,
+        created_at: time ? time.getAttribute("datetime") : null,
+        media
+    };
+})
+"""
 
-class Harvester:
-    def __init__(self, user_data_dir="browser_data", headless=False):
+# 网络模式: 直接解析时间线自己的 GraphQL 响应 (HomeTimeline / HomeLatestTimeline)
+X_MODE = os.getenv("SMTF_X_MODE", "network")  # network / dom
+TIMELINE_ENDPOINT = re.compile(r"/i/api/graphql/[^/]+/Home(Latest)?Timeline")
+
+
+def _find_instructions(node):
+    """时间线响应的嵌套层级随接口变化，直接找 instructions 列表"""
+    if isinstance(node, dict):
+        if isinstance(node.get("instructions"), list):
+            return node["instructions"]
+        for value in node.values():
+            found = _find_instructions(value)
+            if found is not None:
+                return found
+    elif isinstance(node, list):
+        for value in node:
+            found = _find_instructions(value)
+            if found is not None:
+                return found
+    return None
+
+
+def _unwrap_tweet(result):
+    # 受限可见的推文多包一层 TweetWithVisibilityResults
+    if result and result.get("__typename") == "TweetWithVisibilityResults":
+        result = result.get("tweet")
+    if not result or "legacy" not in result:
+        return None
+    return result
+
+
+def _parse_tweet(result):
+    tweet = _unwrap_tweet(result)
+    if tweet is None:
+        return None
+    legacy = tweet["legacy"]
+
+    # 转推: 用原推的全文和图片 (legacy.full_text 只有截断的 "RT @...")
+    retweeted = _unwrap_tweet((legacy.get("retweeted_status_result") or {}).get("result"))
+    source = retweeted or tweet
+    source_legacy = source["legacy"]
+
+    user = ((source.get("core") or {}).get("user_results") or {}).get("result") or {}
+    author = (user.get("core") or {}).get("screen_name") or (user.get("legacy") or {}).get("screen_name") or ""
+
+    # 长推文的全文在 note_tweet 里
+    note = (((source.get("note_tweet") or {}).get("note_tweet_results") or {}).get("result") or {}).get("text")
+    text = note or source_legacy.get("full_text", "")
+
+    media = []
+    entities = source_legacy.get("extended_entities") or source_legacy.get("entities") or {}
+    for item in entities.get("media", []):
+        info = item.get("original_info") or {}
+        media.append({
+            "url": item.get("media_url_https", ""),
+            "type": item.get("type", "photo"),
+            "width": info.get("width", 0),
+            "height": info.get("height", 0),
+        })
+
+    # 转推按原推的 ID 去重，和 DOM 模式取到的 /status/ 链接一致
+    rest_id = source.get("rest_id") or source_legacy.get("id_str")
+    return {
+        "id": rest_id,
+        "url": f"https://x.com/{author or 'i'}/status/{rest_id}",
+        "text": f"@{author} {text}" if author else text,
+        "created_at": source_legacy.get("created_at"),
+        "media": media,
+    }
+
+
+def parse_timeline_payload(payload):
+    """
+    把一次时间线 GraphQL 响应解析成推文列表 (跳过广告)。
+    返回的字段: id / url / text / created_at / media[{url,type,width,height}] (和 DOM 模式的提取结果一致)
+    """
+    tweets = []
+    for instruction in _find_instructions(payload) or []:
+        entries = instruction.get("entries") or ([instruction["entry"]] if instruction.get("entry") else [])
+        for entry in entries:
+            if entry.get("entryId", "").startswith("promoted"):
+                continue
+            content = entry.get("content") or {}
+            # 单条推文 / 对话模块 (一组推文)
+            item_contents = [content.get("itemContent")]
+            item_contents += [(i.get("item") or {}).get("itemContent") for i in content.get("items", [])]
+            for item in item_contents:
+                if not item or item.get("promotedMetadata"):
+                    continue
+                try:
+                    tweet = _parse_tweet((item.get("tweet_results") or {}).get("result"))
+                except Exception:
+                    tweet = None
+                if tweet and tweet["id"]:
+                    tweets.append(tweet)
+    return tweets
+
+
+def _original_url(src):
+    """推图 URL 换成原图"""
+    if "name=" in src:
+        return re.sub(r"name=\w+", "name=orig", src)
+    if "pbs.twimg.com/media/" in src and "?" not in src:
+        # JSON 里给的是不带参数的 media_url_https
+        return f"{src}?name=orig"
+    return src
+
+
+class TimelineCapture:
+    """监听 tab 上的时间线响应，滚动触发的每一页 JSON 都收进来"""
+
+    def __init__(self, page):
+        self.page = page
+        self._reads = []
+
+    def _on_response(self, response):
+        if TIMELINE_ENDPOINT.search(response.url) and response.status == 200:
+            self._reads.append(asyncio.ensure_future(self._read(response)))
+
+    @staticmethod
+    async def _read(response):
+        try:
+            return await response.json()
+        except Exception:
+            return None
+
+    def attach(self):
+        self.page.on("response", self._on_response)
+
+    def detach(self):
+        self.page.remove_listener("response", self._on_response)
+        for task in self._reads:
+            task.cancel()
+        self._reads = []
+
+    async def collect(self):
+        """取出目前为止到达的所有响应，解析成推文列表"""
+        reads, self._reads = self._reads, []
+        tweets = []
+        for payload in await asyncio.gather(*reads):
+            if payload:
+                tweets.extend(parse_timeline_payload(payload))
+        return tweets
+
+
+class Harvester(SessionClient):
+    def __init__(self, user_data_dir="browser_data", headless=False, session=None, mode=X_MODE):
         self.user_data_dir = user_data_dir
+        # network: 解析时间线 JSON (DOM 作为兜底)；dom: 只抓 DOM
+        self.mode = mode
         self.headless = headless
+        # 共享会话由调用方传入；单独运行时自己建一个
+        self.session = session
+        self._stealth_page = None
+        self.images = ImageStore()
+        self.media = MediaDownloader(self.images)
 
-    async def harvest(self, max_posts=5):
-        return await self.harvest_x_timeline(max_posts)
+    def stream(self, max_posts=5, known_ids=None, cursors=None):
+        """
+        X: 命中 known_ids 的帖子在下载图片之前就跳过；首页时间线是算法排序的，只按已处理 ID 判断追上。
+        """
+        return self.harvest_x_timeline(max_posts, known_ids, cursors)
 
-    async def harvest_x_timeline(self, max_posts=5):
-        print(f"[*] [X] Attempting to connect to LOCAL Chrome (Port 9222)...")
+    async def _attach_image(self, page, post, image_url):
+        """图片下载完成后补上 image_path；下载失败且正文太短的帖子丢弃"""
+        try:
+            post["image_path"] = await self.media.save(page, image_url)
+        except Exception as e:
+            print(f"    [!] Image download failed ({post['id']}): {e}")
+        if len(post["text"]) > 20 or post["image_path"]:
+            return post
+        return None
 
-        async with async_playwright() as p:
-            try:
-                # 1. 连接本地 Chrome (强制 IPv4)
-                browser = await p.chromium.connect_over_cdp("http://127.0.0.1:9222")
-                default_context = browser.contexts[0]
-            except Exception as e:
-                print(f"    [!] Connection failed: {e}")
-                print(
-                    r"    👉 请先在终端运行: /Applications/Google\ Chrome.app/Contents/MacOS/Google\ Chrome --remote-debugging-port=9222 --user-data-dir='/tmp/chrome_dev_session'")
-                return []
-
-            # 2. 寻找 X 标签页
-            page = None
-            pages = default_context.pages
-
-            for p_tab in pages:
-                if "x.com" in p_tab.url or "twitter.com" in p_tab.url:
-                    page = p_tab
-                    print("    -> Found existing X tab, reusing...")
-                    # [优化] 注释掉这就不会强制切屏了，让它在后台默默跑
-                    # await page.bring_to_front()
-                    break
+    async def harvest_x_timeline(self, max_posts=5, known_ids=None, cursors=None):
+        print(f"[*] [X] Attaching to shared browser session...")
 
-            if not page:
-                print("    -> No X tab found, opening new one...")
-                page = await default_context.new_page()
-                await page.goto("https://x.com/home")
+        session = self._get_session()
+        try:
+            # 1. 从会话池里取 X 标签页 (没有就新开)
+            page = await session.get_page("x", ("x.com", "twitter.com"), "https://x.com/home")
+        except Exception as e:
+            print(f"    [!] Connection failed: {e}")
+            print(
+                r"    👉 请先在终端运行: /Applications/Google\ Chrome.app/Contents/MacOS/Google\ Chrome --remote-debugging-port=9222 --user-data-dir='/tmp/chrome_dev_session'")
+            return
 
-            # [核心黑科技] CDP 强制伪装可见性
+        # 2. [核心黑科技] CDP 强制伪装可见性 (每个 tab 只需设置一次)
+        if page is not self._stealth_page:
             try:
-                # 使用 default_context 创建会话更稳健
-                client = await default_context.new_cdp_session(page)
+                client = await session.context.new_cdp_session(page)
                 # 告诉 Chrome: "嘿，你就在屏幕最中间，用户正盯着你看呢"
                 await client.send("Emulation.setFocusEmulationEnabled", {"enabled": True})
                 await client.send("Emulation.setCPUThrottlingRate", {"rate": 1})
                 await client.send("Emulation.setAutoDarkModeOverride", {"enabled": False})
+                self._stealth_page = page
                 print("    -> [Stealth] CDP visibility spoofing active.")
             except Exception as e:
                 print(f"    [!] CDP Warning: {e}")
 
-            # 3. 刷新与加载
-            print("    -> Refreshing timeline...")
-            try:
-                await page.reload(wait_until="domcontentloaded")
-                await page.wait_for_selector('[data-testid="tweet"]', state="visible", timeout=15000)
-                print("    -> Timeline ready.")
-            except:
-                print("    [!] Timeline timeout. Please check Chrome window manually.")
-                # 断开连接，不杀进程
-                await browser.close()
-                return []
-
-            # 4. 抓取流程
-            print("    -> Scraping timeline...")
-            posts_data = []
-            seen_ids = set()
-            os.makedirs("assets/images", exist_ok=True)
-
-            for i in range(3):
-                tweets = await page.locator('[data-testid="tweet"]').all()
-                print(f"       (Scroll {i + 1}) Visible tweets: {len(tweets)}")
+        # 网络模式: 刷新之前就开始监听，第一页 JSON 不会漏掉
+        capture = None
+        if self.mode == "network":
+            capture = TimelineCapture(page)
+            capture.attach()
 
-                for tweet in tweets:
-                    if len(posts_data) >= max_posts: break
+        # 3. 刷新与加载
+        print("    -> Refreshing timeline...")
+        try:
+            await page.reload(wait_until="domcontentloaded")
+            await page.wait_for_selector('[data-testid="tweet"]', state="visible", timeout=15000)
+            print("    -> Timeline ready.")
+        except:
+            print("    [!] Timeline timeout. Please check Chrome window manually.")
+            if capture:
+                capture.detach()
+            return
+
+        # 4. 抓取流程
+        print("    -> Scraping timeline...")
+        harvested = 0
+        seen_ids = set()
+        # 首页是算法排序，不按时间戳判断，只看连续命中已处理 ID
+        cursor = cursors.cursor("x", chronological=False) if cursors else None
 
+        pending = set()  # 图片还在下载的帖子
+        try:
+            # 滚动由新推文节点的插入驱动: 内容到了就处理，feed 不再产出新内容就停
+            scroller = ScrollDriver(page, '[data-testid="tweet"]', step=(800, 1500))
+            async for i in scroller.rounds():
+                tweets = await capture.collect() if capture else []
+                if tweets:
+                    print(f"       (Scroll {i + 1}) Timeline JSON tweets: {len(tweets)}")
+                else:
+                    # DOM 兜底: 一次 evaluate 拿到整屏推文的结构化数据 (原来每条推文要十几次 CDP 往返)
                     try:
-                        extracted_id = None
+                        tweets = await page.evaluate(EXTRACT_TWEETS_JS)
+                    except Exception as e:
+                        print(f"    [!] Extraction failed: {e}")
+                        tweets = []
+                    print(f"       (Scroll {i + 1}) Visible tweets: {len(tweets)}")
+
+                for tweet in tweets:
+                    if harvested >= max_posts: break
+
+                    clean_text = (tweet["text"] or "").replace("\n", " ").strip()
+                    if tweet["id"]:
+                        extracted_id = f"x_{tweet['id']}"
+                        final_url = tweet["url"]
+                    else:
+                        extracted_id = f"x_hash_{hash(clean_text)}"
                         final_url = ""
 
-                        # ID / URL 提取
-                        links = await tweet.locator('a[href*="/status/"]').all()
-                        for link in links:
-                            href = await link.get_attribute("href")
-                            if "/status/" in href:
-                                parts = href.split("/status/")
-                                if len(parts) > 1:
-                                    possible_id = parts[1].split("/")[0].split("?")[0]
-                                    if possible_id.isdigit():
-                                        extracted_id = f"x_{possible_id}"
-                                        final_url = f"https://x.com{href}"
-                                        break
-
-                        text = await tweet.inner_text()
-                        clean_text = text.replace("\n", " ").strip()
-                        if not extracted_id: extracted_id = f"x_hash_{hash(clean_text)}"
-
-                        if extracted_id in seen_ids: continue
-
-                        # 图片下载 (直接复用 Page Request)
-                        image_local_path = None
-                        photo_divs = await tweet.locator('[data-testid="tweetPhoto"] img').all()
-
-                        if photo_divs:
-                            img_src = await photo_divs[0].get_attribute("src")
-                            if img_src:
-                                # 替换为原图
-                                if "name=" in img_src:
-                                    high_res_src = re.sub(r"name=\w+", "name=orig", img_src)
-                                else:
-                                    high_res_src = img_src
-
-                                ext = "jpg"
-                                if "format=png" in high_res_src: ext = "png"
-                                filename = f"assets/images/{extracted_id}.{ext}"
-
-                                try:
-                                    # 利用当前页面的 Context 下载，最安全
-                                    response = await page.request.get(high_res_src)
-                                    if response.status == 200:
-                                        with open(filename, "wb") as f:
-                                            f.write(await response.body())
-                                        image_local_path = filename
-                                except:
-                                    pass
-
-                        if len(clean_text) > 20 or image_local_path:
-                            seen_ids.add(extracted_id)
-                            posts_data.append({
-                                "id": extracted_id,
-                                "text": clean_text[:500],
-                                "url": final_url,
-                                "image_path": image_local_path
-                            })
-
-                    except Exception:
+                    if extracted_id in seen_ids: continue
+
+                    # 已经处理过的帖子: 不下载图片，直接跳过
+                    if known_ids is not None and extracted_id in known_ids:
+                        seen_ids.add(extracted_id)
+                        if cursor:
+                            cursor.observe(extracted_id, tweet.get("created_at"), known=True)
                         continue
 
-                if len(posts_data) >= max_posts: break
+                    # 只收集原图 URL，下载交给 MediaDownloader 并发进行；
+                    # 整组图片都记进 media 清单，下载失败时回填不用再打开页面
+                    media = [manifest_entry(_original_url(m["url"]), m.get("width"), m.get("height"))
+                             for m in tweet["media"] if m.get("url")]
+                    image_url = media[0]["url"] if media else None
+
+                    if len(clean_text) > 20 or image_url:
+                        seen_ids.add(extracted_id)
+                        harvested += 1
+                        if cursor:
+                            cursor.observe(extracted_id, tweet.get("created_at"))
+                        post = {
+                            "id": extracted_id,
+                            "text": clean_text[:500],
+                            "url": final_url,
+                            "image_path": None,
+                            "media": media
+                        }
+                        if image_url:
+                            pending.add(asyncio.create_task(self._attach_image(page, post, image_url)))
+                        else:
+                            yield post
 
-                # 随机滚动模拟
-                await page.mouse.wheel(0, random.randint(800, 1500))
-                await asyncio.sleep(random.uniform(2.0, 4.0))
+                # 图片已下载完的帖子先吐出去
+                for post in pop_finished(pending):
+                    yield post
 
-            print(f"    -> Harvested {len(posts_data)} posts.")
+                if harvested >= max_posts: break
+                if cursor and cursor.caught_up:
+                    print("       (Caught up with the last run, stop scrolling)")
+                    break
 
-            # [重要] 只是断开连接，Chrome 依然在后台运行
-            await browser.close()
-            print("    -> Disconnected (Chrome stays open).")
+            # 剩下的按完成顺序吐出: 整页耗时约等于最慢的那张图，而不是所有图之和
+            async for post in drain(pending):
+                yield post
+        finally:
+            # 调用方提前关闭 (超时/达到上限) 时别留下悬空的下载任务
+            for task in pending:
+                task.cancel()
+            if capture:
+                capture.detach()
 
-            return posts_data
+        print(f"    -> Harvested {harvested} posts.")
+        # [重要] 不再断开连接，tab 留在会话池里给下一轮复用
 
 
-if __name__ == "__main__":
+async def _main():
     h = Harvester()
-    asyncio.run(h.harvest(3))
+    try:
+        await h.harvest(3)
+    finally:
+        await h.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,176 @@
+import os
+import sys
+import time
+import sqlite3
+import hashlib
+import argparse
+import tempfile
+
+DB_NAME = "smtf_memory.db"
+IMG_DIR = "assets/images"
+
+# GC 时不碰最近写入的文件: 采集端先落图、后入库，中间有时间差
+GC_GRACE_SECONDS = 3600
+
+
+def sniff_ext(data: bytes) -> str:
+    """按文件头判断扩展名 (X 的 format=png、截图兜底的 jpeg 都能对上)"""
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return "jpg"
+
+
+class ImageStore:
+    """
+    内容寻址的图片仓库: 文件名 = SHA-256，按前两级目录分片
+    (assets/images/ab/cd/abcd....jpg)。
+    同一张图不管出现在多少个帖子里都只存一份；引用计数直接来自 processed_posts.image_path。
+    """
+
+    def __init__(self, root=IMG_DIR):
+        self.root = root
+
+    def path_for(self, digest: str, ext: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}.{ext}")
+
+    def put(self, data: bytes, ext: str = None) -> str:
+        """写入图片字节，返回仓库内路径 (已存在则直接复用)"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest, ext or sniff_ext(data))
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再原子替换，并发写同一张图也不会读到半截文件。
+            # 临时文件名每次唯一 (多个线程可能同时写同一张图)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except OSError:
+                # 内容相同: 别人先写完了就算成功
+                if not os.path.exists(path):
+                    raise
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        return path
+
+    def put_file(self, src_path: str) -> str:
+        with open(src_path, "rb") as f:
+            return self.put(f.read())
+
+    def is_managed(self, path: str) -> bool:
+        """是否已经是分片后的内容寻址路径"""
+        rel = os.path.relpath(path, self.root)
+        parts = rel.split(os.sep)
+        return len(parts) == 3 and len(parts[0]) == 2 and parts[2].startswith(parts[0] + parts[1])
+
+    @staticmethod
+    def reference_counts(conn) -> dict:
+        """image_path -> 引用它的帖子数"""
+        rows = conn.execute('''
+            SELECT image_path, COUNT(*) FROM processed_posts
+            WHERE image_path IS NOT NULL AND image_path != ''
+            GROUP BY image_path
+        ''').fetchall()
+        return {os.path.normpath(path): count for path, count in rows}
+
+    def migrate_legacy(self, conn, dry_run=False) -> int:
+        """
+        把旧的平铺文件 (assets/images/{post_id}.jpg) 搬进仓库并改写 image_path。
+        同一张图的多个副本会合并成一份；旧文件在数据库提交后才删除。
+        """
+        rows = conn.execute('''
+            SELECT post_id, image_path FROM processed_posts
+            WHERE image_path IS NOT NULL AND image_path != ''
+        ''').fetchall()
+
+        updates = []
+        old_files = set()
+        for post_id, path in rows:
+            if self.is_managed(path) or not os.path.exists(path):
+                continue
+            new_path = path if dry_run else self.put_file(path)
+            updates.append((new_path, post_id))
+            old_files.add(os.path.normpath(path))
+
+        print(f"    -> {len(updates)} rows point at legacy files ({len(old_files)} files).")
+        if dry_run or not updates:
+            return len(updates)
+
+        with conn:
+            conn.executemany("UPDATE processed_posts SET image_path = ? WHERE post_id = ?", updates)
+
+        still_used = self.reference_counts(conn)
+        for path in old_files:
+            if path not in still_used:
+                os.remove(path)
+        return len(updates)
+
+    def gc(self, conn, grace_seconds=GC_GRACE_SECONDS, dry_run=False):
+        """
+        删除没有任何帖子引用的图片 (引用计数为 0)。
+        派生文件 (同一 digest 开头，例如预处理缓存) 跟随原图一起保留/删除。
+        返回 (删除文件数, 释放字节数)。
+        """
+        referenced = self.reference_counts(conn)
+        live_stems = {os.path.basename(p).split(".")[0] for p in referenced}
+        cutoff = time.time() - grace_seconds
+
+        removed, freed = 0, 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.normpath(os.path.join(dirpath, name))
+                # 写到一半中断留下的 .tmp 不算派生文件
+                if not name.endswith(".tmp") and (path in referenced or name.split(".")[0] in live_stems):
+                    continue
+                st = os.stat(path)
+                if st.st_mtime > cutoff:
+                    continue
+                removed += 1
+                freed += st.st_size
+                if not dry_run:
+                    os.remove(path)
+
+        # 空的分片目录留着: 最多 256*256 个，删了反而会和并发的 put() 抢同一个目录
+        return removed, freed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Content-addressed image store maintenance.")
+    parser.add_argument("command", choices=["migrate", "gc", "stats"])
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不改动文件和数据库")
+    parser.add_argument("--grace-hours", type=float, default=GC_GRACE_SECONDS / 3600,
+                        help="GC 跳过最近 N 小时内写入的文件")
+    args = parser.parse_args()
+
+    if not os.path.exists(DB_NAME):
+        print("❌ Database not found.")
+        sys.exit(1)
+
+    store = ImageStore()
+    conn = sqlite3.connect(DB_NAME, timeout=30.0)
+    try:
+        if args.command == "migrate":
+            print("[*] Migrating legacy images into the content-addressed store...")
+            count = store.migrate_legacy(conn, dry_run=args.dry_run)
+            print(f"[✅] Migrated {count} rows.")
+        elif args.command == "gc":
+            print("[*] Collecting unreferenced images...")
+            removed, freed = store.gc(conn, grace_seconds=args.grace_hours * 3600, dry_run=args.dry_run)
+            verb = "Would remove" if args.dry_run else "Removed"
+            print(f"[✅] {verb} {removed} files ({freed / 1024 / 1024:.1f} MB).")
+        else:
+            counts = store.reference_counts(conn)
+            shared = sum(1 for c in counts.values() if c > 1)
+            print(f"    -> {len(counts)} distinct images referenced, {shared} shared by multiple posts.")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
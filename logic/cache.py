@@ -0,0 +1,143 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+CACHE_DB = os.getenv("SMTF_CACHE_DB", "analysis_cache.db")
+CACHE_TTL = float(os.getenv("SMTF_CACHE_TTL_DAYS", "30")) * 86400
+CACHE_MAX_ENTRIES = int(os.getenv("SMTF_CACHE_MAX_ENTRIES", "50000"))
+MEMORY_ENTRIES = 2048
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """转发/复制带来的差异 (全半角、大小写、空白) 不应该产生新的 key"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return _WS.sub(" ", text).strip().casefold()
+
+
+class AnalysisCache:
+    """
+    analyze_post 的内容寻址缓存。
+    key = sha256(归一化文本 + 图片摘要 + 模型名 + prompt 版本)，
+    内存 LRU 挡在前面 (命中不碰磁盘)，SQLite 负责持久化，按 TTL 和条数上限淘汰。
+    """
+
+    def __init__(self, db_path=CACHE_DB, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._memory = OrderedDict()  # key -> (result, created_at)
+        self._digests = OrderedDict() # (path, size, mtime_ns) -> sha256，和 _memory 一样限长
+        self._lock = threading.Lock()
+        self._puts = 0
+
+        self.conn = sqlite3.connect(db_path, timeout=30.0, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                key TEXT PRIMARY KEY,
+                result TEXT,
+                created_at INTEGER,
+                last_hit INTEGER
+            )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_hit ON analysis_cache(last_hit)")
+        self.conn.commit()
+        self.evict()
+
+    def image_digest(self, image_path: str) -> str:
+        if not image_path or not os.path.exists(image_path):
+            return ""
+        st = os.stat(image_path)
+        stamp = (image_path, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(stamp)
+            if digest is not None:
+                self._digests.move_to_end(stamp)
+                return digest
+
+        # 哈希在锁外做，不挡住其他线程的缓存读写
+        h = hashlib.sha256()
+        with open(image_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        with self._lock:
+            self._digests[stamp] = digest
+            while len(self._digests) > MEMORY_ENTRIES:
+                self._digests.popitem(last=False)
+        return digest
+
+    def make_key(self, text: str, image_path: str, model: str, prompt_version: str) -> str:
+        # 有图路径但文件丢失时走的是另一条分析路径，不能和纯文本共用 key
+        image_part = self.image_digest(image_path) or ("missing" if image_path else "")
+        parts = [normalize_text(text), image_part, model, prompt_version]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                result, created_at = entry
+                if now - created_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    return dict(result)
+                del self._memory[key]
+
+            row = self.conn.execute(
+                "SELECT result, created_at FROM analysis_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            if now - row[1] > self.ttl:
+                self.conn.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+
+            self.conn.execute("UPDATE analysis_cache SET last_hit = ? WHERE key = ?", (int(now), key))
+            self.conn.commit()
+            result = json.loads(row[0])
+            self._remember(key, result, row[1])
+            return dict(result)
+
+    def put(self, key: str, result: dict):
+        now = int(time.time())
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache (key, result, created_at, last_hit) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(result, ensure_ascii=False), now, now)
+            )
+            self.conn.commit()
+            self._remember(key, dict(result), now)
+            self._puts += 1
+        # 不必每次都扫表
+        if self._puts % 200 == 0:
+            self.evict()
+
+    def _remember(self, key, result, created_at):
+        self._memory[key] = (result, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+
+    def evict(self):
+        """先删过期，再按最近命中时间把超出上限的部分删掉"""
+        cutoff = int(time.time() - self.ttl)
+        with self._lock:
+            self.conn.execute("DELETE FROM analysis_cache WHERE created_at < ?", (cutoff,))
+            self.conn.execute('''
+                DELETE FROM analysis_cache WHERE key IN (
+                    SELECT key FROM analysis_cache ORDER BY last_hit DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,))
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
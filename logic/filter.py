@@ -1,61 +1,349 @@
 import os
+import json
+import asyncio
 import typing
 from datetime import datetime
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
-from PIL import Image
+from pydantic import BaseModel
+from .cache import AnalysisCache
+from .image_prep import prepare_image, prep_signature
 
 load_dotenv()
 API_KEY = os.getenv("GEMINI_API_KEY")
 
+# 异步审计的默认并发上限 / 单次请求超时 (秒)，可用环境变量覆盖
+MAX_INFLIGHT = int(os.getenv("SMTF_MAX_INFLIGHT", "8"))
+REQUEST_TIMEOUT = float(os.getenv("SMTF_REQUEST_TIMEOUT", "120"))
+
+# Stage 1 批量分拣: 每批最多几条 / 异步攒批最多等几秒
+TRIAGE_BATCH_SIZE = int(os.getenv("SMTF_TRIAGE_BATCH", "30"))
+TRIAGE_MAX_WAIT = float(os.getenv("SMTF_TRIAGE_WAIT", "2.0"))
+
+# 任何 prompt / 解析逻辑改动都要改这个版本号，旧缓存自动失效
+PROMPT_VERSION = "v3.3"
+
+
+class TriageDecision(BaseModel):
+    """批量分拣时模型对单条帖子的结构化判断"""
+    index: int
+    worth_checking: bool
+
 
 class ContentFilter:
-    def __init__(self):
+    def __init__(self, max_inflight: int = MAX_INFLIGHT, request_timeout: float = REQUEST_TIMEOUT,
+                 use_cache: bool = True):
         self.client = genai.Client(api_key=API_KEY)
         self.fast_model = "gemini-3-flash-preview"
         self.smart_model = "gemini-3-pro-preview"
 
+        # 异步接口: 同时在途的 Gemini 请求数上限 + 单次超时
+        self.max_inflight = max_inflight
+        self.request_timeout = request_timeout
+        self._inflight = asyncio.Semaphore(max_inflight)
+
+        # 异步 Stage 1 攒批: [(text, future), ...]，满一批或超时就合并成一次请求
+        self.triage_batch_size = TRIAGE_BATCH_SIZE
+        self.triage_max_wait = TRIAGE_MAX_WAIT
+        self._triage_pending = []
+        self._triage_timer = None
+        self._triage_tasks = set()
+
+        # 结果缓存 (转发/重跑的同一内容不再重复调用 Gemini) + 同 key 在途请求合并
+        self.cache = AnalysisCache() if use_cache else None
+        self._pending_audits = {}  # key -> [task, waiters]
+
+    @staticmethod
+    def _stage1_noise(post_text: str) -> dict:
+        return {
+            "original_text": post_text,
+            "is_relevant": False,
+            "verdict": "NOISE",
+            "summary": "Filtered by Stage 1 (Irrelevant/Spam)"
+        }
+
+    def _cache_key(self, post_text: str, image_path: str = None):
+        if self.cache is None:
+            return None
+        # 图片帖的模型输入是压缩后的派生图，压缩参数变了也要换 key
+        version = f"{PROMPT_VERSION}/{prep_signature()}" if image_path else PROMPT_VERSION
+        return self.cache.make_key(post_text, image_path, self.fast_model, version)
+
+    def _cache_store(self, key, result: dict):
+        # 报错结果不缓存，下次还要重试
+        if key and not str(result.get("summary", "")).startswith("Error:"):
+            self.cache.put(key, result)
+
     def analyze_post(self, post_text: str, image_path: str = None) -> dict:
+        key = self._cache_key(post_text, image_path)
+        if key:
+            hit = self.cache.get(key)
+            if hit:
+                hit["original_text"] = post_text
+                return hit
+
+        result = self._analyze_uncached(post_text, image_path)
+        self._cache_store(key, result)
+        return result
+
+    def _analyze_uncached(self, post_text: str, image_path: str = None) -> dict:
         if not image_path:
             if not self._is_worth_checking(post_text):
-                return {
-                    "original_text": post_text,
-                    "is_relevant": False,
-                    "verdict": "NOISE",
-                    "summary": "Filtered by Stage 1 (Irrelevant/Spam)"
-                }
+                return self._stage1_noise(post_text)
         return self._perform_deep_audit(post_text, image_path)
 
-    def _is_worth_checking(self, text: str) -> bool:
-        prompt = f"""
+    async def analyze_post_async(self, post_text: str, image_path: str = None) -> dict:
+        """
+        analyze_post 的异步版本 (基于 client.aio)，不阻塞事件循环。
+        并发受 max_inflight 限制；被取消时 CancelledError 会直接向上抛出。
+        缓存命中直接返回；同一 key 已在途时合并为一个请求，最后一个等待方取消时才真正取消请求。
+        """
+        # 算 key (要哈希图片) 和查 SQLite 都是阻塞 IO，放到线程里做
+        key = await asyncio.to_thread(self._cache_key, post_text, image_path)
+        if not key:
+            return await self._analyze_uncached_async(post_text, image_path)
+
+        hit = await asyncio.to_thread(self.cache.get, key)
+        if hit:
+            hit["original_text"] = post_text
+            return hit
+
+        entry = self._pending_audits.get(key)
+        if entry is None:
+            task = asyncio.create_task(self._analyze_and_store_async(key, post_text, image_path))
+            entry = self._pending_audits[key] = [task, 0]
+            task.add_done_callback(lambda _t, k=key: self._pending_audits.pop(k, None))
+
+        entry[1] += 1
+        try:
+            result = await asyncio.shield(entry[0])
+        except asyncio.CancelledError:
+            if entry[1] == 1:
+                entry[0].cancel()
+            raise
+        finally:
+            entry[1] -= 1
+
+        result = dict(result)
+        result["original_text"] = post_text
+        return result
+
+    async def _analyze_and_store_async(self, key, post_text: str, image_path: str = None) -> dict:
+        result = await self._analyze_uncached_async(post_text, image_path)
+        await asyncio.to_thread(self._cache_store, key, result)
+        return result
+
+    async def _analyze_uncached_async(self, post_text: str, image_path: str = None) -> dict:
+        if not image_path:
+            if not await self._is_worth_checking_async(post_text):
+                return self._stage1_noise(post_text)
+        return await self._perform_deep_audit_async(post_text, image_path)
+
+    async def _generate_async(self, **kwargs):
+        """所有异步请求的统一出口: 限流 + 超时"""
+        async with self._inflight:
+            return await asyncio.wait_for(
+                self.client.aio.models.generate_content(**kwargs),
+                timeout=self.request_timeout
+            )
+
+    @staticmethod
+    def _triage_prompt(text: str) -> str:
+        return f"""
         Analyze this post. Return ONLY 'YES' if it contains factual claims, news, or meaningful opinions/discussions.
         Return 'NO' if it is obvious spam, simple greeting, or pure emotion without context.
         Post: "{text}"
         """
+
+    def _is_worth_checking(self, text: str) -> bool:
         try:
             response = self.client.models.generate_content(
                 model=self.fast_model,
-                contents=prompt
+                contents=self._triage_prompt(text)
             )
             return "YES" in response.text.strip().upper()
         except:
             return True
 
+    async def _is_worth_checking_single_async(self, text: str) -> bool:
+        try:
+            response = await self._generate_async(
+                model=self.fast_model,
+                contents=self._triage_prompt(text)
+            )
+            return "YES" in response.text.strip().upper()
+        except Exception:
+            return True
+
+    async def _is_worth_checking_async(self, text: str) -> bool:
+        """
+        异步 Stage 1 不再单条请求，而是挂到当前批次上等结果。
+        批次满 triage_batch_size 条立即发送，否则最多等 triage_max_wait 秒。
+        """
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._triage_pending.append((text, fut))
+
+        if len(self._triage_pending) >= self.triage_batch_size:
+            self._flush_triage()
+        elif self._triage_timer is None:
+            self._triage_timer = loop.call_later(self.triage_max_wait, self._flush_triage)
+        return await fut
+
+    def _flush_triage(self):
+        if self._triage_timer is not None:
+            self._triage_timer.cancel()
+            self._triage_timer = None
+
+        batch, self._triage_pending = self._triage_pending, []
+        # 等待方已经被取消的就不用再问了
+        batch = [(text, fut) for text, fut in batch if not fut.done()]
+        if not batch:
+            return
+
+        task = asyncio.create_task(self._resolve_triage_batch(batch))
+        self._triage_tasks.add(task)
+        task.add_done_callback(self._triage_tasks.discard)
+
+    async def _resolve_triage_batch(self, batch):
+        try:
+            decisions = await self.triage_batch_async([text for text, _ in batch])
+        except Exception:
+            # 兜底: 宁可多查也不漏
+            decisions = [True] * len(batch)
+        for (_, fut), decision in zip(batch, decisions):
+            if not fut.done():
+                fut.set_result(decision)
+
+    # --- Stage 1 批量接口 ---
+
+    @staticmethod
+    def _batch_triage_prompt(texts: list[str]) -> str:
+        items = "\n".join(f"[{i}] {json.dumps(t, ensure_ascii=False)}" for i, t in enumerate(texts))
+        return f"""
+        You will receive {len(texts)} social media posts, each prefixed with its index in brackets.
+        For EVERY post decide:
+        - worth_checking = true if it contains factual claims, news, or meaningful opinions/discussions.
+        - worth_checking = false if it is obvious spam, simple greeting, or pure emotion without context.
+        Return a JSON array with exactly one object per post: {{"index": <int>, "worth_checking": <bool>}}.
+
+        Posts:
+        {items}
+        """
+
+    @staticmethod
+    def _batch_triage_config():
+        return types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=list[TriageDecision]
+        )
+
+    @staticmethod
+    def _parse_batch_triage(response, n: int) -> dict:
+        """解析为 {index: bool}；缺失/越界的条目交给调用方单独重试"""
+        decisions = response.parsed
+        if not isinstance(decisions, list):
+            decisions = [TriageDecision(**d) for d in json.loads(response.text)]
+
+        result = {}
+        for d in decisions:
+            if isinstance(d, dict):
+                d = TriageDecision(**d)
+            if 0 <= d.index < n:
+                result[d.index] = d.worth_checking
+        return result
+
+    async def triage_batch_async(self, texts: list[str]) -> list[bool]:
+        """
+        批量 Stage 1: 一次请求判断多条帖子是否值得深度核查。
+        结构化结果解析失败 (或漏了某几条) 时，对缺的那几条并发退回单条判断。
+        """
+        results = []
+        for start in range(0, len(texts), self.triage_batch_size):
+            chunk = texts[start:start + self.triage_batch_size]
+            try:
+                response = await self._generate_async(
+                    model=self.fast_model,
+                    contents=self._batch_triage_prompt(chunk),
+                    config=self._batch_triage_config()
+                )
+                decided = self._parse_batch_triage(response, len(chunk))
+            except Exception as e:
+                print(f"    [!] Batch triage failed, falling back to single calls: {e}")
+                decided = {}
+
+            missing = [i for i in range(len(chunk)) if i not in decided]
+            if missing:
+                singles = await asyncio.gather(*[
+                    self._is_worth_checking_single_async(chunk[i]) for i in missing
+                ])
+                decided.update(zip(missing, singles))
+
+            results.extend(decided[i] for i in range(len(chunk)))
+        return results
+
+    @staticmethod
+    def _load_image(image_path: str):
+        """
+        读取压缩后的派生图 (见 image_prep)，直接以字节 Part 上传。
+        不再把原图的 PIL 对象交给 SDK: 上传体积小，也不会泄漏文件句柄。
+        """
+        prepared = prepare_image(image_path)
+        if prepared is None:
+            return None
+        data, mime_type = prepared
+        return types.Part.from_bytes(data=data, mime_type=mime_type)
+
     def _perform_deep_audit(self, text: str, image_path: str = None) -> dict:
+        image = self._load_image(image_path)
+        contents, config = self._build_audit_request(text, image)
+        try:
+            response = self.client.models.generate_content(
+                model=self.fast_model,
+                contents=contents,
+                config=config
+            )
+            return self._parse_audit_response(text, response)
+        except Exception as e:
+            return self._audit_error(text, e)
+
+    async def _perform_deep_audit_async(self, text: str, image_path: str = None) -> dict:
+        # 解码/缩放/编码是 CPU + 磁盘活，放到线程里
+        image = await asyncio.to_thread(self._load_image, image_path)
+        contents, config = self._build_audit_request(text, image)
+        try:
+            response = await self._generate_async(
+                model=self.fast_model,
+                contents=contents,
+                config=config
+            )
+            return self._parse_audit_response(text, response)
+        except asyncio.TimeoutError:
+            return self._audit_error(text, f"Timeout after {self.request_timeout:.0f}s")
+        except Exception as e:
+            return self._audit_error(text, e)
+
+    @staticmethod
+    def _audit_error(text: str, error) -> dict:
+        return {
+            "original_text": text,
+            "is_relevant": True,
+            "verdict": "MIXED",
+            "summary": f"Error: {str(error)}"
+        }
+
+    def _build_audit_request(self, text: str, image=None):
+        """组装 Stage 2 的 contents + config (同步/异步共用)"""
         today_str = datetime.now().strftime("%Y-%m-%d")
-        print(f"    -> Auditing (Date: {today_str}, Img: {bool(image_path)})...")
+        print(f"    -> Auditing (Date: {today_str}, Img: {image is not None})...")
 
         contents = []
         has_image = False
 
-        if image_path and os.path.exists(image_path):
-            try:
-                image = Image.open(image_path)
-                contents.append(image)
-                has_image = True
-            except Exception as e:
-                print(f"    [!] Image load failed: {e}")
+        if image is not None:
+            contents.append(image)
+            has_image = True
 
         # --- 基础指令 ---
         base_instructions = f"""
@@ -105,49 +393,40 @@ class ContentFilter:
         prompt = f"{base_instructions}\n\nPost Text Metadata: \"{text}\""
         contents.append(prompt)
 
-        try:
-            response = self.client.models.generate_content(
-                model=self.fast_model,
-                contents=contents,
-                config=types.GenerateContentConfig(
-                    tools=[types.Tool(google_search=types.GoogleSearch())]
-                )
-            )
-
-            res_text = response.text if response.text else "No response."
-
-            # 结果解析
+        config = types.GenerateContentConfig(
+            tools=[types.Tool(google_search=types.GoogleSearch())]
+        )
+        return contents, config
+
+    @staticmethod
+    def _parse_audit_response(text: str, response) -> dict:
+        res_text = response.text if response.text else "No response."
+
+        # 结果解析
+        verdict = "MIXED"
+        if "[VERDICT: TRUE]" in res_text:
+            verdict = "TRUE"
+        elif "[VERDICT: FALSE]" in res_text:
+            verdict = "FALSE"
+        elif "[VERDICT: MIXED]" in res_text:
             verdict = "MIXED"
-            if "[VERDICT: TRUE]" in res_text:
-                verdict = "TRUE"
-            elif "[VERDICT: FALSE]" in res_text:
+        else:
+            upper = res_text.upper()
+            if "FALSE" in upper:
                 verdict = "FALSE"
-            elif "[VERDICT: MIXED]" in res_text:
-                verdict = "MIXED"
-            else:
-                upper = res_text.upper()
-                if "FALSE" in upper:
-                    verdict = "FALSE"
-                elif "TRUE" in upper and "NOT TRUE" not in upper:
-                    verdict = "TRUE"
-
-            if response.candidates and response.candidates[0].grounding_metadata:
-                if response.candidates[0].grounding_metadata.search_entry_point:
-                    res_text += "\n\n(🔍 Verified via Google Search)"
-
-            return {
-                "original_text": text,
-                "is_relevant": True,
-                "verdict": verdict,
-                "summary": res_text
-            }
-        except Exception as e:
-            return {
-                "original_text": text,
-                "is_relevant": True,
-                "verdict": "MIXED",
-                "summary": f"Error: {str(e)}"
-            }
+            elif "TRUE" in upper and "NOT TRUE" not in upper:
+                verdict = "TRUE"
+
+        if response.candidates and response.candidates[0].grounding_metadata:
+            if response.candidates[0].grounding_metadata.search_entry_point:
+                res_text += "\n\n(🔍 Verified via Google Search)"
+
+        return {
+            "original_text": text,
+            "is_relevant": True,
+            "verdict": verdict,
+            "summary": res_text
+        }
 
     # ... (Analyst / Chat 保持不变) ...
     def generate_daily_briefing(self, posts_text_list: list[str]) -> str:
@@ -0,0 +1,103 @@
+import io
+import os
+import math
+import tempfile
+from PIL import Image, ImageOps
+
+# 送给 Gemini 之前的压缩参数，可用环境变量覆盖
+PREP_MAX_EDGE = int(os.getenv("SMTF_IMG_MAX_EDGE", "1600"))
+PREP_MAX_PIXELS = int(os.getenv("SMTF_IMG_MAX_PIXELS", "2000000"))
+PREP_FORMAT = os.getenv("SMTF_IMG_FORMAT", "jpeg").lower()   # jpeg / webp
+PREP_QUALITY = int(os.getenv("SMTF_IMG_QUALITY", "82"))
+
+# Dashboard 列表里的缩略图
+THUMB_MAX_EDGE = 320
+THUMB_QUALITY = 70
+
+MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+EXTENSIONS = {"jpeg": "jpg", "webp": "webp"}
+
+
+def prep_signature(max_edge=PREP_MAX_EDGE, max_pixels=PREP_MAX_PIXELS, fmt=PREP_FORMAT, quality=PREP_QUALITY):
+    """参数指纹: 既是派生文件名的一部分，也进分析缓存的 key"""
+    return f"prep{max_edge}e{max_pixels // 1000}k{quality}q{fmt}"
+
+
+def derivative_path(image_path, max_edge=PREP_MAX_EDGE, max_pixels=PREP_MAX_PIXELS,
+                    fmt=PREP_FORMAT, quality=PREP_QUALITY):
+    """
+    派生文件放在原图旁边: abcd....png -> abcd....png.prep1600e2000k82qjpeg.jpg
+    文件名前缀和原图一致，image_store 的 GC 会跟着原图一起保留/删除。
+    """
+    sig = prep_signature(max_edge, max_pixels, fmt, quality)
+    return f"{image_path}.{sig}.{EXTENSIONS[fmt]}"
+
+
+def _target_size(width, height, max_edge, max_pixels):
+    scale = min(1.0, max_edge / max(width, height), math.sqrt(max_pixels / (width * height)))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def _encode(image_path, max_edge, max_pixels, fmt, quality):
+    with Image.open(image_path) as im:
+        size = _target_size(im.width, im.height, max_edge, max_pixels)
+        # JPEG 可以在解码阶段直接降采样，大图不用整张解到内存里
+        im.draft("RGB", size)
+        img = ImageOps.exif_transpose(im)
+
+        if img.mode not in ("RGB", "L"):
+            # 透明图铺白底 (JPEG 不支持 alpha)
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel("A"))
+
+        size = _target_size(img.width, img.height, max_edge, max_pixels)
+        if size != img.size:
+            img = img.resize(size, Image.LANCZOS)
+
+        buf = io.BytesIO()
+        img.save(buf, format=fmt.upper(), quality=quality, optimize=True)
+        return buf.getvalue()
+
+
+def prepare_image(image_path, max_edge=PREP_MAX_EDGE, max_pixels=PREP_MAX_PIXELS,
+                  fmt=PREP_FORMAT, quality=PREP_QUALITY):
+    """
+    归一化方向、限制长边和像素总数、重新编码。
+    返回 (bytes, mime_type)；结果缓存在原图旁边，第二次直接读文件。
+    失败或文件不存在返回 None。
+    """
+    if not image_path or not os.path.exists(image_path):
+        return None
+
+    out = derivative_path(image_path, max_edge, max_pixels, fmt, quality)
+    mime = MIME_TYPES[fmt]
+    try:
+        if os.path.exists(out) and os.path.getmtime(out) >= os.path.getmtime(image_path):
+            with open(out, "rb") as f:
+                return f.read(), mime
+
+        data = _encode(image_path, max_edge, max_pixels, fmt, quality)
+        # 临时文件名每次唯一: 多个线程 / Streamlit 会话可能同时为同一张图生成派生文件
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(out) or ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, out)
+        except OSError:
+            # 没抢到替换也没关系，内存里的结果照样能用
+            pass
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return data, mime
+    except Exception as e:
+        print(f"    [!] Image prep failed ({image_path}): {e}")
+        return None
+
+
+def thumbnail(image_path, max_edge=THUMB_MAX_EDGE):
+    """Dashboard 用的小图 (JPEG bytes)，同样缓存成派生文件；失败返回 None"""
+    result = prepare_image(image_path, max_edge=max_edge, max_pixels=max_edge * max_edge,
+                           fmt="jpeg", quality=THUMB_QUALITY)
+    return result[0] if result else None
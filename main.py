@@ -1,7 +1,7 @@
 import asyncio
 import os
 import argparse
-import time
+from contextlib import aclosing
 from logic.filter import ContentFilter
 # 导入各个 Harvester
 from harvester import Harvester as XHarvester
@@ -9,87 +9,169 @@ from weibo_harvester import WeiboHarvester
 # Reddit 暂时还没更新多模态，先留着
 from reddit_harvester import RedditHarvester
 from database import Database
+from browser_session import BrowserSession
+from watermark import HarvestCursors
 from editor import Editor
 
+# 每个平台的采集时限 (秒)，超时只停止该平台继续采集，不影响其他平台
+HARVEST_DEADLINES = {
+    "X (Twitter)": 180,
+    "Weibo": 300,
+    "Reddit": 120,
+}
+DEFAULT_HARVEST_DEADLINE = 180
+
+# 采集 -> 审计之间的缓冲上限，队列满时采集端会暂停等待
+AUDIT_QUEUE_SIZE = 20
+
 
 class SocialMediaTruthFilter:
     def __init__(self, headless=False):
         self.db = Database()
         self.filter_engine = ContentFilter()
         self.editor = Editor()
+        # 所有平台共用一个 CDP 连接，跨多次 harvest 保持不断开
+        self.session = BrowserSession()
 
         # 注册收割者
         self.harvesters = [
-            ("X (Twitter)", XHarvester(headless=headless)),
-            ("Weibo", WeiboHarvester(headless=headless)),
-            ("Reddit", RedditHarvester(headless=headless))
+            ("X (Twitter)", XHarvester(headless=headless, session=self.session)),
+            ("Weibo", WeiboHarvester(headless=headless, session=self.session)),
+            ("Reddit", RedditHarvester(headless=headless, session=self.session))
         ]
 
-    async def run_pipeline(self, is_cron=False):
-        print(f"\n[{'CRON' if is_cron else 'MANUAL'}] Starting SMTF Pipeline...")
-
-        all_new_insights = []
-        limit = 10 if is_cron else 5
-
-        # 1. 轮询平台
-        for platform_name, harvester in self.harvesters:
-            print(f"\n[A] Harvesting {platform_name}...")
-
+    @staticmethod
+    def _normalize_id(platform_name, post):
+        # 统一 ID 格式 (X 已经加了前缀，Weibo 也加了，Reddit 需要确认)
+        # 简单起见，这里做个双重保险
+        raw_id = str(post['id'])
+        if platform_name == "X (Twitter)" and not raw_id.startswith("x_"):
+            return f"x_{raw_id}"
+        elif platform_name == "Reddit" and not raw_id.startswith("reddit_"):
+            return f"reddit_{raw_id}"
+        return raw_id  # Weibo 自带 wb_ 前缀
+
+    async def _flush_periodically(self):
+        """审计结果攒批落盘的定时器: 结果来得慢时不用等下一条进队列才提交"""
+        while True:
+            await asyncio.sleep(self.db.flush_interval)
+            self.db.flush_if_due()
+
+    async def _harvest_platform(self, platform_name, harvester, limit, queue, known_ids, cursors=None):
+        """单个平台的生产者: 边抓边往队列里塞，独立超时 + 异常隔离，互不拖累"""
+        deadline = HARVEST_DEADLINES.get(platform_name, DEFAULT_HARVEST_DEADLINE)
+        print(f"\n[A] Harvesting {platform_name} (deadline {deadline}s)...")
+
+        async def pump():
+            count = 0
+            async with aclosing(harvester.stream(max_posts=limit, known_ids=known_ids, cursors=cursors)) as posts:
+                async for post in posts:
+                    # 队列满了就在这里等，采集速度自动被审计速度拖住，内存不会涨
+                    await queue.put((platform_name, post))
+                    count += 1
+            return count
+
+        try:
+            count = await asyncio.wait_for(pump(), timeout=deadline)
+            if not count:
+                print(f"    -> No posts from {platform_name}.")
+        except asyncio.TimeoutError:
+            # 已经进队列的帖子照常审计，只是停止继续滚动
+            print(f"    [!] {platform_name} harvest exceeded {deadline}s, stopped.")
+        except Exception as e:
+            print(f"    [!] Error harvesting {platform_name}: {e}")
+            # 打印详细堆栈方便调试，生产环境可去掉
+            # import traceback; traceback.print_exc()
+
+    async def _audit_worker(self, queue, insights, known_ids):
+        """消费者: 从队列取帖子 -> 去重 -> AI 分析 -> 存库"""
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+
+            platform_name, post = item
             try:
-                # 统一调用 harvest 接口
-                raw_posts = await harvester.harvest(max_posts=limit)
+                final_id = self._normalize_id(platform_name, post)
+                post['id'] = final_id
 
-                if not raw_posts:
-                    print(f"    -> No posts from {platform_name}.")
+                # 查库去重 (采集端已经用 known_ids 挡掉绝大部分，这里兜底)
+                if final_id in known_ids or self.db.is_processed(final_id):
                     continue
+                known_ids.add(final_id)
 
-                print(f"[B] Auditing {len(raw_posts)} posts from {platform_name}...")
-
-                for post in raw_posts:
-                    # 统一 ID 格式 (X 已经加了前缀，Weibo 也加了，Reddit 需要确认)
-                    # 简单起见，这里做个双重保险
-                    raw_id = str(post['id'])
-                    if platform_name == "X (Twitter)" and not raw_id.startswith("x_"):
-                        final_id = f"x_{raw_id}"
-                    elif platform_name == "Reddit" and not raw_id.startswith("reddit_"):
-                        final_id = f"reddit_{raw_id}"
-                    else:
-                        final_id = raw_id  # Weibo 自带 wb_ 前缀
+                # AI 分析 (传入文本和图片路径)
+                print(f"    -> Analyzing: {final_id[:15]}...")
 
-                    post['id'] = final_id
+                img_path = post.get('image_path')
+                # 异步接口: 不阻塞同一事件循环里的 Playwright，并发由 ContentFilter 限流
+                analysis = await self.filter_engine.analyze_post_async(post['text'], image_path=img_path)
 
-                    # 查库去重
-                    if self.db.is_processed(final_id):
-                        continue
+                # 存库 (攒批提交，一批一个事务)
+                self.db.queue_result(post, analysis)
 
-                    # AI 分析 (传入文本和图片路径)
-                    print(f"    -> Analyzing: {final_id[:15]}...")
+                # [核心修改] 适配新的 Verdict 显示逻辑
+                verdict = analysis.get('verdict', 'MIXED')
+                is_rel = analysis.get('is_relevant', False)
 
-                    img_path = post.get('image_path')
-                    analysis = self.filter_engine.analyze_post(post['text'], image_path=img_path)
+                if is_rel and verdict != 'NOISE':
+                    print(f"    [✅ {verdict}] {platform_name}")
+                    insights.append(analysis)
+                else:
+                    print(f"    [❌ {verdict}] {analysis.get('relevance_reason', 'Dropped')}")
 
-                    # 存库
-                    self.db.save_result(post, analysis)
-
-                    # [核心修改] 适配新的 Verdict 显示逻辑
-                    verdict = analysis.get('verdict', 'MIXED')
-                    is_rel = analysis.get('is_relevant', False)
+            except Exception as e:
+                print(f"    [!] Error auditing {platform_name}: {e}")
 
-                    if is_rel and verdict != 'NOISE':
-                        print(f"    [✅ {verdict}] {platform_name}")
-                        all_new_insights.append(analysis)
-                    else:
-                        print(f"    [❌ {verdict}] {analysis.get('relevance_reason', 'Dropped')}")
+    async def run_pipeline(self, is_cron=False, concurrent=True):
+        print(f"\n[{'CRON' if is_cron else 'MANUAL'}] Starting SMTF Pipeline...")
 
-                    # 礼貌等待
-                    time.sleep(1)
+        all_new_insights = []
+        limit = 10 if is_cron else 5
 
-            except Exception as e:
-                print(f"    [!] Error harvesting {platform_name}: {e}")
-                # 打印详细堆栈方便调试，生产环境可去掉
-                # import traceback; traceback.print_exc()
+        # 已处理 ID 一次性读进内存，采集端提取到 ID 就能判断，不用等下载完图片再查库
+        known_ids = self.db.load_processed_ids()
+        print(f"    -> Loaded {len(known_ids)} processed IDs for dedup.")
+        # 各来源的增量水位: 追上上次的进度就不再往下滚
+        cursors = HarvestCursors(self.db)
+
+        # 采集与审计同时进行: 生产者 (各平台) -> 有界队列 -> 多个审计消费者
+        queue = asyncio.Queue(maxsize=AUDIT_QUEUE_SIZE)
+        # worker 数要大于在途上限，Stage 1 才能攒出整批；真正的 API 并发仍由 ContentFilter 控制
+        n_workers = self.filter_engine.max_inflight + self.filter_engine.triage_batch_size
+        auditors = [
+            asyncio.create_task(self._audit_worker(queue, all_new_insights, known_ids)) for _ in range(n_workers)
+        ]
 
-        # 2. 生成报告 (Legacy HTML Report)
+        flusher = asyncio.create_task(self._flush_periodically())
+
+        try:
+            # 1. 采集: 默认三个平台同时跑 (各自一个标签页，共用同一个 CDP 端口)
+            if concurrent:
+                await asyncio.gather(*[
+                    self._harvest_platform(name, harvester, limit, queue, known_ids, cursors)
+                    for name, harvester in self.harvesters
+                ])
+            else:
+                for name, harvester in self.harvesters:
+                    await self._harvest_platform(name, harvester, limit, queue, known_ids, cursors)
+        finally:
+            try:
+                # 2. 采集结束，通知所有审计 worker 收尾
+                for _ in auditors:
+                    await queue.put(None)
+                await asyncio.gather(*auditors)
+            finally:
+                # 把最后不满一批的结果落盘 (Ctrl+C 也不丢已经审计完的)
+                flusher.cancel()
+                self.db.flush()
+
+        # 正常跑完、帖子都入库之后才推进水位；Ctrl+C / 采集异常会直接跳过这里
+        cursors.save()
+        print("\n[B] Harvest summary:")
+        cursors.report()
+
+        # 3. 生成报告 (Legacy HTML Report)
         # Dashboard 已经是主力了，这个 HTML 报告作为备用
         should_report = len(all_new_insights) > 0 or (not is_cron)
 
@@ -105,14 +187,23 @@ class SocialMediaTruthFilter:
         else:
             print("    -> No new insights. Silent mode.")
 
+    async def close(self):
+        await self.session.close()
+        self.db.close()
+
+
+async def _run(app, is_cron, concurrent):
+    try:
+        await app.run_pipeline(is_cron=is_cron, concurrent=concurrent)
+    finally:
+        await app.close()
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--cron", action="store_true")
+    parser.add_argument("--sequential", action="store_true", help="逐个平台采集 (调试用)")
     args = parser.parse_args()
 
     app = SocialMediaTruthFilter(headless=args.cron)
-    try:
-        asyncio.run(app.run_pipeline(is_cron=args.cron))
-    finally:
-        app.db.close()
\ No newline at end of file
+    asyncio.run(_run(app, is_cron=args.cron, concurrent=not args.sequential))
\ No newline at end of file
@@ -0,0 +1,177 @@
+import os
+import base64
+import random
+import asyncio
+from urllib.parse import urlsplit, parse_qs
+
+# 小于这个字节数的多半是占位图 / 防盗链提示图
+MIN_IMAGE_BYTES = 2000
+
+# 并发下载: 全局上限 / 单个 host 上限 / 失败重试次数，可用环境变量覆盖
+MAX_DOWNLOADS = int(os.getenv("SMTF_MAX_DOWNLOADS", "8"))
+PER_HOST_DOWNLOADS = int(os.getenv("SMTF_PER_HOST_DOWNLOADS", "4"))
+DOWNLOAD_RETRIES = int(os.getenv("SMTF_DOWNLOAD_RETRIES", "2"))
+
+CONTENT_TYPES = {"jpg": "image/jpeg", "jpeg": "image/jpeg", "png": "image/png", "gif": "image/gif",
+                 "webp": "image/webp"}
+
+
+def guess_content_type(url):
+    """按 URL 推断图片类型 (X 的 ?format=png 优先于路径后缀)"""
+    parts = urlsplit(url or "")
+    fmt = parse_qs(parts.query).get("format")
+    ext = fmt[0] if fmt else os.path.splitext(parts.path)[1].lstrip(".")
+    return CONTENT_TYPES.get(ext.lower(), "image/jpeg")
+
+
+def manifest_entry(url, width=0, height=0, content_type=None):
+    """
+    采集时记下的一张图 (post["media"] 里的一项，入库到 post_media):
+    原图 URL + 尺寸 + 类型。下载失败后可以直接按 URL 重新拉，不用再打开帖子页面。
+    """
+    try:
+        width, height = int(width or 0), int(height or 0)
+    except (TypeError, ValueError):
+        width, height = 0, 0
+    return {"url": url, "width": width, "height": height,
+            "content_type": content_type or guess_content_type(url)}
+
+
+async def fetch_bytes(page, url, referer=None, timeout=15000):
+    """
+    通过页面所在 context 的请求通道直接拿响应体 (二进制)，
+    cookie 与浏览器共享，Referer 默认取当前页面。
+    不再在页面里 fetch -> FileReader -> base64 字符串 -> Python 解码，省掉 1/3 的膨胀和多份拷贝。
+    失败返回 None。
+    """
+    try:
+        response = await page.request.get(
+            url,
+            headers={"Referer": referer or page.url},
+            timeout=timeout,
+        )
+        if response.status != 200:
+            return None
+        body = await response.body()
+        await response.dispose()
+        if len(body) < MIN_IMAGE_BYTES:
+            return None
+        return body
+    except Exception:
+        return None
+
+
+async def capture_element(page, element, quality=80):
+    """
+    截图兜底: 用 CDP Page.captureScreenshot 只截元素所在区域 (JPEG)。
+    比 element.screenshot 少一轮稳定性等待和整页合成。失败返回 None。
+    """
+    client = None
+    try:
+        await element.scroll_into_view_if_needed()
+        box = await element.bounding_box()
+        if not box or box["width"] < 1 or box["height"] < 1:
+            return None
+
+        client = await page.context.new_cdp_session(page)
+        # bounding_box 是视口坐标，clip 要的是文档坐标
+        metrics = await client.send("Page.getLayoutMetrics")
+        viewport = metrics.get("cssVisualViewport") or metrics.get("visualViewport") or {}
+        result = await client.send("Page.captureScreenshot", {
+            "format": "jpeg",
+            "quality": quality,
+            "clip": {
+                "x": box["x"] + viewport.get("pageX", 0),
+                "y": box["y"] + viewport.get("pageY", 0),
+                "width": box["width"],
+                "height": box["height"],
+                "scale": 1,
+            },
+        })
+        return base64.b64decode(result["data"])
+    except Exception:
+        return None
+    finally:
+        if client is not None:
+            try:
+                await client.detach()
+            except Exception:
+                pass
+
+
+class MediaDownloader:
+    """
+    有界并发的图片下载器: 全局并发上限 + 每个 host 单独限流，失败按指数退避重试。
+    采集端在提取 DOM 时只收集 URL，把下载交给这里，滚动不再等 CDN。
+    """
+
+    def __init__(self, store, max_concurrency=MAX_DOWNLOADS, per_host=PER_HOST_DOWNLOADS,
+                 retries=DOWNLOAD_RETRIES, backoff=0.8):
+        self.store = store
+        self.max_concurrency = max_concurrency
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self._global = None
+        self._hosts = {}  # host -> Semaphore
+        self._capture_lock = None  # 截图要滚动页面，同一时间只截一张
+
+    def _semaphores(self, url):
+        # 信号量要在运行中的事件循环里创建
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.max_concurrency)
+            self._capture_lock = asyncio.Lock()
+        host = urlsplit(url).hostname or ""
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host)
+        return self._global, self._hosts[host]
+
+    async def fetch(self, page, url, referer=None):
+        overall, per_host = self._semaphores(url)
+        for attempt in range(self.retries + 1):
+            async with per_host:
+                async with overall:
+                    body = await fetch_bytes(page, url, referer=referer)
+            if body:
+                return body
+            if attempt < self.retries:
+                await asyncio.sleep(self.backoff * (2 ** attempt) * random.uniform(0.8, 1.2))
+        return None
+
+    async def save_first(self, page, urls, referer=None):
+        """按顺序尝试多个 URL (例如一条帖子的 media 清单)，返回第一张下载成功的本地路径"""
+        for url in urls:
+            body = await self.fetch(page, url, referer=referer)
+            if body:
+                return await asyncio.to_thread(self.store.put, body)
+        return None
+
+    async def save(self, page, url, referer=None, fallback_element=None, quality=80):
+        """下载并写入图片仓库，返回本地路径；下载失败且给了元素时用 CDP 截图兜底"""
+        body = await self.fetch(page, url, referer=referer) if url else None
+        if body:
+            return await asyncio.to_thread(self.store.put, body)
+        if fallback_element is not None:
+            if self._capture_lock is None:
+                self._capture_lock = asyncio.Lock()
+            async with self._capture_lock:
+                shot = await capture_element(page, fallback_element, quality=quality)
+            if shot:
+                return await asyncio.to_thread(self.store.put, shot, "jpg")
+        return None
+
+
+def pop_finished(pending):
+    """从 pending 任务集合里取出已完成的帖子 (结果为 None 的视为丢弃)"""
+    done = [task for task in pending if task.done()]
+    pending.difference_update(done)
+    return [task.result() for task in done if not task.cancelled() and task.result()]
+
+
+async def drain(pending):
+    """按完成顺序吐出剩余的帖子"""
+    for future in asyncio.as_completed(list(pending)):
+        post = await future
+        if post:
+            yield post
+    pending.clear()
@@ -1,36 +1,19 @@
-import sqlite3
 import os
+from database import Database, SCHEMA_VERSION
 
 DB_NAME = "smtf_memory.db"
 
 
 def migrate():
     if not os.path.exists(DB_NAME):
-        print("❌ Database not found.")
+        print("❌ Database not found. Nothing to migrate.")
         return
 
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-
-    print(f"[*] Starting V3 migration for {DB_NAME}...")
-
-    # 创建简报存档表
-    # date_key: 日期字符串 (例如 "2025-01-01")
-    # context_hash: 只要当天的帖子内容变了（比如你手动修改了 verdict），我们就重新生成，用来做缓存失效检测
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS briefings (
-            date_key TEXT PRIMARY KEY,
-            content TEXT,
-            context_hash TEXT, 
-            created_at TIMESTAMP
-        )
-    ''')
-
-    print("    -> Table 'briefings' created/verified.")
-    conn.commit()
-    conn.close()
-    print("[✅] Migration V3 complete.")
+    # briefings 简报存档表已并入 database.MIGRATIONS，打开 Database 时会自动补齐，这里保留只是为了兼容旧习惯
+    print(f"[*] Starting migration for {DB_NAME}...")
+    Database(DB_NAME).close()
+    print(f"[✅] Migration V3 complete. Schema is at v{SCHEMA_VERSION}.")
 
 
 if __name__ == "__main__":
-    migrate()
\ No newline at end of file
+    migrate()
@@ -1,5 +1,5 @@
-import sqlite3
 import os
+from database import Database, SCHEMA_VERSION
 
 DB_NAME = "smtf_memory.db"
 IMG_DIR = "assets/images"
@@ -12,23 +12,10 @@ def migrate():
         print(f"[+] Created image directory: {IMG_DIR}")
 
     # 2. 修改数据库
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-
-    # 获取列名
-    cursor.execute("PRAGMA table_info(processed_posts)")
-    columns = [info[1] for info in cursor.fetchall()]
-
-    if 'image_path' not in columns:
-        print("    -> Adding column: image_path")
-        cursor.execute("ALTER TABLE processed_posts ADD COLUMN image_path TEXT")
-    else:
-        print("    -> Column 'image_path' already exists.")
-
-    conn.commit()
-    conn.close()
-    print("[✅] Migration V4 complete. Ready for Screenshots.")
+    # image_path 字段已并入 database.MIGRATIONS，打开 Database 时会自动补齐，这里保留只是为了兼容旧习惯
+    Database(DB_NAME).close()
+    print(f"[✅] Migration V4 complete. Schema is at v{SCHEMA_VERSION}.")
 
 
 if __name__ == "__main__":
-    migrate()
\ No newline at end of file
+    migrate()
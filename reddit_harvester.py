@@ -1,89 +1,110 @@
 import asyncio
-from playwright.async_api import async_playwright
-import os
-
-
-class RedditHarvester:
-    def __init__(self, user_data_dir="browser_data", headless=False):
+from browser_session import SessionClient, ScrollDriver
+from media import manifest_entry
+
+# 单次注入的提取脚本: shreddit-post 的关键信息都在属性上
+EXTRACT_REDDIT_JS = """
+() => Array.from(document.querySelectorAll("shreddit-post")).map(el => ({
+    id: el.getAttribute("id"),
+    promoted: el.getAttribute("promoted"),
+    title: el.getAttribute("post-title"),
+    permalink: el.getAttribute("permalink"),
+    author: el.getAttribute("author") || "",
+    created_at: el.getAttribute("created-timestamp"),
+    media: el.getAttribute("post-type") === "image" && el.getAttribute("content-href")
+        ? [{url: el.getAttribute("content-href"), width: 0, height: 0}] : []
+}))
+"""
+
+
+class RedditHarvester(SessionClient):
+    def __init__(self, user_data_dir="browser_data", headless=False, session=None):
         self.headless = headless
+        self.session = session
         self.source_prefix = "reddit"
 
-    async def harvest(self, max_posts=5):
-        print(f"[*] [Reddit] Connecting to Canary (Port 9222)...")
-
-        async with async_playwright() as p:
-            try:
-                browser = await p.chromium.connect_over_cdp("http://127.0.0.1:9222")
-                default_context = browser.contexts[0]
-            except Exception as e:
-                print(f"    [!] Connection failed: {e}")
-                return []
+    async def stream(self, max_posts=5, known_ids=None, cursors=None):
+        """
+        Reddit: 图片帖只记 URL，不下载；首页 feed 是算法排序的，只按连续命中已处理 ID 判断追上。
+        """
+        print(f"[*] [Reddit] Attaching to shared browser session...")
 
+        session = self._get_session()
+        try:
             # 寻找或新建 Reddit 标签页
-            page = None
-            for p_tab in default_context.pages:
-                if "reddit.com" in p_tab.url:
-                    page = p_tab
-                    print("    -> Found existing Reddit tab, reusing...")
-                    # await page.bring_to_front()
-                    break
-
-            if not page:
-                print("    -> Opening new Reddit tab...")
-                page = await default_context.new_page()
-                await page.goto("https://www.reddit.com/")
-
-            # 刷新以获取新内容
-            await page.reload()
-
+            page = await session.get_page("reddit", ("reddit.com",), "https://www.reddit.com/")
+        except Exception as e:
+            print(f"    [!] Connection failed: {e}")
+            return
+
+        # 刷新以获取新内容
+        await page.reload()
+
+        # 登录状态在同一会话内只检查一次
+        if not await session.ensure_login("reddit", page, 'shreddit-post', timeout=8000):
+            return
+
+        print("    -> Scraping Reddit feed...")
+        harvested = 0
+        seen_ids = set()
+        # feed 不是按时间排序的，只看连续命中已处理 ID
+        cursor = cursors.cursor("reddit", chronological=False) if cursors else None
+
+        scroller = ScrollDriver(page, "shreddit-post", step=1000)
+        async for i in scroller.rounds():
+            # 一次 evaluate 读完整屏帖子的属性 (原来每条帖子 4 次 get_attribute 往返)
             try:
-                await page.wait_for_selector('shreddit-post', state="visible", timeout=8000)
-            except:
-                print("    [!] Reddit content not found. Waiting...")
-                await page.wait_for_selector('shreddit-post', timeout=0)
-
-            print("    -> Scraping Reddit feed...")
-            posts_data = []
-            seen_ids = set()
-
-            for i in range(3):
-                posts = await page.locator('shreddit-post').all()
-                print(f"       (Scroll {i + 1}) Found {len(posts)} posts.")
-
-                for post in posts:
-                    if len(posts_data) >= max_posts: break
-                    try:
-                        raw_id = await post.get_attribute("id")
-                        is_promoted = await post.get_attribute("promoted")
-                        if is_promoted == "true": continue
-
-                        title = await post.get_attribute("post-title")
-                        permalink = await post.get_attribute("permalink")
-
-                        unique_id = f"{self.source_prefix}_{raw_id}"
-                        if unique_id in seen_ids: continue
-
-                        full_text = f"[Reddit] {title}\n(Link: https://www.reddit.com{permalink})"
-
-                        seen_ids.add(unique_id)
-                        posts_data.append({
-                            "id": unique_id,
-                            "text": full_text,
-                            "url": f"https://www.reddit.com{permalink}"
-                        })
-                    except:
-                        continue
-
-                if len(posts_data) >= max_posts: break
-                await page.mouse.wheel(0, 1000)
-                await asyncio.sleep(2)
-
-            print(f"    -> [Reddit] Harvest complete.")
-            await browser.close()  # 断开连接
-            return posts_data
+                posts = await page.evaluate(EXTRACT_REDDIT_JS)
+            except Exception as e:
+                print(f"    [!] Extraction failed: {e}")
+                posts = []
+            print(f"       (Scroll {i + 1}) Found {len(posts)} posts.")
+
+            for post in posts:
+                if harvested >= max_posts: break
+                if post["promoted"] == "true" or not post["id"]: continue
+
+                title = post["title"]
+                permalink = post["permalink"]
+
+                unique_id = f"{self.source_prefix}_{post['id']}"
+                if unique_id in seen_ids: continue
+                if known_ids is not None and unique_id in known_ids:
+                    seen_ids.add(unique_id)
+                    if cursor:
+                        cursor.observe(unique_id, post["created_at"], known=True)
+                    continue
+
+                full_text = f"[Reddit] {title}\n(Link: https://www.reddit.com{permalink})"
+
+                seen_ids.add(unique_id)
+                harvested += 1
+                if cursor:
+                    cursor.observe(unique_id, post["created_at"])
+                yield {
+                    "id": unique_id,
+                    "text": full_text,
+                    "url": f"https://www.reddit.com{permalink}",
+                    # 图片帖只记 URL (Reddit 目前不下载图片)
+                    "media": [manifest_entry(m["url"]) for m in post["media"] if m.get("url")]
+                }
+
+            if harvested >= max_posts: break
+            if cursor and cursor.caught_up:
+                print("       (Caught up with the last run, stop scrolling)")
+                break
+
+        print(f"    -> [Reddit] Harvest complete.")
+
+
+async def _main():
+    r = RedditHarvester()
+    try:
+        data = await r.harvest(3)
+    finally:
+        await r.close()
+    print(data)
 
 
 if __name__ == "__main__":
-    r = RedditHarvester()
-    data = asyncio.run(r.harvest(3))
-    print(data)
\ No newline at end of file
+    asyncio.run(_main())
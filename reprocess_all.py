@@ -2,11 +2,16 @@ import sqlite3
 import time
 import os
 from logic.filter import ContentFilter
+from database import Database
 
 # --- [核心修改] 获取当前脚本所在的绝对路径 ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # 拼接数据库的完整路径
 DB_PATH = os.path.join(BASE_DIR, "smtf_memory.db")
+# 每攒够这么多条结果提交一次 (一个事务)
+COMMIT_BATCH = 20
+# 或者距离上次提交超过这么多秒 (慢速重跑时也能及时落盘)
+COMMIT_INTERVAL = 30
 
 
 def reprocess_all():
@@ -23,8 +28,8 @@ def reprocess_all():
         print(f"    [!] Engine Init Failed: {e}")
         return
 
-    conn = sqlite3.connect(DB_PATH)  # 使用绝对路径连接
-    cursor = conn.cursor()
+    db = Database(DB_PATH)  # 使用绝对路径连接
+    cursor = db.cursor
 
     # ... 后面的代码保持不变 ...
     # 1. 选取所有非噪音数据
@@ -38,39 +43,42 @@ def reprocess_all():
     except sqlite3.OperationalError as e:
         print(f"❌ Database Error: {e}")
         print("Tip: Are you sure 'smtf_memory.db' is in the same folder as this script?")
+        db.close()
         return
 
     print(f"[*] Found {len(rows)} records to standardize.")
 
     updated_count = 0
-    for i, (post_id, text, img_path) in enumerate(rows):
-        print(f"[{i + 1}/{len(rows)}] Auditing {post_id}...")
-
-        try:
-            # 调用新逻辑
-            analysis = filter_engine.analyze_post(text, image_path=img_path)
-
-            new_verdict = analysis.get('verdict', 'MIXED')
-            new_summary = analysis.get('summary', '')
-
-            # 更新数据库
-            cursor.execute('''
-                UPDATE processed_posts 
-                SET verdict = ?, summary = ?
-                WHERE post_id = ?
-            ''', (new_verdict, new_summary, post_id))
-
-            conn.commit()
-            print(f"    -> Result: {new_verdict}")
-            updated_count += 1
-
-        except Exception as e:
-            print(f"    [!] Error: {e}")
-
-        # 稍微快一点
-        time.sleep(0.5)
-
-    conn.close()
+    pending = []
+    last_commit = time.monotonic()
+    try:
+        for i, (post_id, text, img_path) in enumerate(rows):
+            print(f"[{i + 1}/{len(rows)}] Auditing {post_id}...")
+
+            try:
+                # 调用新逻辑
+                analysis = filter_engine.analyze_post(text, image_path=img_path)
+
+                new_verdict = analysis.get('verdict', 'MIXED')
+                new_summary = analysis.get('summary', '')
+
+                # 更新数据库 (攒批提交)
+                pending.append((post_id, new_verdict, new_summary))
+                if len(pending) >= COMMIT_BATCH or time.monotonic() - last_commit >= COMMIT_INTERVAL:
+                    updated_count += db.update_analyses(pending)
+                    pending = []
+                    last_commit = time.monotonic()
+                print(f"    -> Result: {new_verdict}")
+
+            except Exception as e:
+                print(f"    [!] Error: {e}")
+
+            # 稍微快一点
+            time.sleep(0.5)
+    finally:
+        # 中断 (Ctrl+C) 时也把已经分析完的结果落盘
+        updated_count += db.update_analyses(pending)
+        db.close()
     print(f"\n[✅] Standardization Complete. Updated {updated_count} records.")
 
 
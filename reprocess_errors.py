@@ -1,8 +1,12 @@
-import sqlite3
 import time
 from logic.filter import ContentFilter
+from database import Database
 
 DB_NAME = "smtf_memory.db"
+# 每攒够这么多条修复结果提交一次 (一个事务)
+COMMIT_BATCH = 20
+# 或者距离上次提交超过这么多秒 (慢速重跑时也能及时落盘)
+COMMIT_INTERVAL = 30
 
 
 def reprocess():
@@ -16,8 +20,8 @@ def reprocess():
         print(f"    [!] Failed to load engine: {e}")
         return
 
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    db = Database(DB_NAME)
+    cursor = db.cursor
 
     # 2. 查找脏数据 [修正SQL]
     # 我们只检查 summary 列，因为数据库里没有 fact_check_notes 列
@@ -31,50 +35,52 @@ def reprocess():
 
     if not rows:
         print("✅ No error records found. Database is clean.")
+        db.close()
         return
 
     print(f"[*] Found {len(rows)} records to re-process.")
 
     # 3. 重新跑 AI 分析
     updated_count = 0
-    for i, (post_id, text, img_path) in enumerate(rows):
-        print(f"[{i + 1}/{len(rows)}] Reprocessing {post_id}...")
-
-        try:
-            # 调用 filter.py 重新分析
-            analysis = filter_engine.analyze_post(text, image_path=img_path)
-
-            # 获取新的分析结果
-            # 注意：filter返回的是 'fact_check_notes'，我们要把它存入数据库的 'summary' 列
-            new_summary = analysis.get('fact_check_notes', '')
-
-            # 简单的错误检查
-            if "Error" not in new_summary and "404" not in new_summary:
-                verdict = "TRUE" if analysis['fact_check_passed'] else "WARNING"
-                if not analysis['is_relevant']:
-                    verdict = "NOISE"
-
-                # [修正SQL] 更新语句只更新存在的列
-                cursor.execute('''
-                    UPDATE processed_posts 
-                    SET verdict = ?, summary = ?
-                    WHERE post_id = ?
-                ''', (verdict, new_summary, post_id))
-
-                conn.commit()
-                print(f"    ✅ Fixed.")
-                updated_count += 1
-            else:
-                # 如果还是报错，可能是 API 问题或者网络问题
-                fail_reason = new_summary[:50].replace('\n', ' ')
-                print(f"    ❌ Still failing: {fail_reason}...")
-
-        except Exception as e:
-            print(f"    [!] Script Crash: {e}")
-
-        time.sleep(1)
-
-    conn.close()
+    pending = []
+    last_commit = time.monotonic()
+    try:
+        for i, (post_id, text, img_path) in enumerate(rows):
+            print(f"[{i + 1}/{len(rows)}] Reprocessing {post_id}...")
+
+            try:
+                # 调用 filter.py 重新分析
+                analysis = filter_engine.analyze_post(text, image_path=img_path)
+
+                # 获取新的分析结果 (filter 现在直接返回 verdict + summary)
+                new_summary = analysis.get('summary', '')
+
+                # 简单的错误检查
+                if "Error" not in new_summary and "404" not in new_summary:
+                    verdict = analysis.get('verdict', 'MIXED')
+                    if not analysis.get('is_relevant', True):
+                        verdict = "NOISE"
+
+                    # 攒批提交，一批一个事务
+                    pending.append((post_id, verdict, new_summary))
+                    if len(pending) >= COMMIT_BATCH or time.monotonic() - last_commit >= COMMIT_INTERVAL:
+                        updated_count += db.update_analyses(pending)
+                        pending = []
+                        last_commit = time.monotonic()
+                    print(f"    ✅ Fixed.")
+                else:
+                    # 如果还是报错，可能是 API 问题或者网络问题
+                    fail_reason = new_summary[:50].replace('\n', ' ')
+                    print(f"    ❌ Still failing: {fail_reason}...")
+
+            except Exception as e:
+                print(f"    [!] Script Crash: {e}")
+
+            time.sleep(1)
+    finally:
+        # 中断 (Ctrl+C) 时也把已经分析完的结果落盘
+        updated_count += db.update_analyses(pending)
+        db.close()
     print(f"\n[Done] Reprocessed. Successfully fixed {updated_count} records.")
 
 
@@ -1,7 +1,7 @@
-import sqlite3
 import os
 import sys
 from logic.filter import ContentFilter
+from database import Database
 
 # 路径修复：确保能找到数据库
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -17,14 +17,15 @@ def reprocess_one(target_id):
 
     # 1. 初始化大脑
     try:
-        filter_engine = ContentFilter()
+        # 单条重跑就是要一个新结果，绕过分析缓存
+        filter_engine = ContentFilter(use_cache=False)
         print(f"    -> AI Engine loaded ({filter_engine.fast_model})")
     except Exception as e:
         print(f"    [!] Failed to load AI: {e}")
         return
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    db = Database(DB_PATH)
+    cursor = db.cursor
 
     # 2. 获取该帖子的原始数据
     cursor.execute('SELECT original_text, image_path, url FROM processed_posts WHERE post_id = ?', (target_id,))
@@ -32,7 +33,7 @@ def reprocess_one(target_id):
 
     if not row:
         print(f"❌ Post ID '{target_id}' not found in database.")
-        conn.close()
+        db.close()
         return
 
     original_text, image_path, url = row
@@ -55,19 +56,13 @@ def reprocess_one(target_id):
 
         # 4. 更新数据库
         # 注意：我们会顺便清空 manual_verdict，确保 Dashboard 显示的是这个最新的 AI 结果
-        cursor.execute('''
-            UPDATE processed_posts 
-            SET verdict = ?, summary = ?, manual_verdict = NULL 
-            WHERE post_id = ?
-        ''', (new_verdict, new_summary, target_id))
-
-        conn.commit()
+        db.update_analyses([(target_id, new_verdict, new_summary)], clear_manual=True)
         print(f"✅ Database updated successfully!")
 
     except Exception as e:
         print(f"❌ Analysis Failed: {e}")
 
-    conn.close()
+    db.close()
 
 
 if __name__ == "__main__":
@@ -1,6 +1,8 @@
 import sqlite3
 import os
 import glob
+from image_store import ImageStore
+from database import migrate
 
 DB_NAME = "smtf_memory.db"
 IMG_DIR = "assets/images"
@@ -9,37 +11,46 @@ IMG_DIR = "assets/images"
 def reset():
     print("[*] Starting Weibo Image Cleanup...")
 
-    # 1. 删除本地文件
-    # 找到所有 wb_ 开头的图片
-    pattern = os.path.join(IMG_DIR, "wb_*")
-    files = glob.glob(pattern)
+    if not os.path.exists(DB_NAME):
+        print("    [!] Database not found.")
+        return
+
+    conn = sqlite3.connect(DB_NAME)
+    migrate(conn)
+    cursor = conn.cursor()
+
+    # 1. 重置数据库 (先记下微博引用过的图片)
+    cursor.execute("SELECT DISTINCT image_path FROM processed_posts WHERE post_id LIKE 'wb_%' AND image_path IS NOT NULL")
+    wb_paths = {os.path.normpath(r[0]) for r in cursor.fetchall() if r[0]}
+
+    # 将所有微博的 image_path 设为 NULL
+    cursor.execute("UPDATE processed_posts SET image_path = NULL WHERE post_id LIKE 'wb_%'")
+    changes = conn.total_changes
+    # 回填记录一起清掉，否则 backfill 会当成"已经处理过"跳过
+    cursor.execute("DELETE FROM backfill_attempts WHERE post_id LIKE 'wb_%'")
+    conn.commit()
+    print(f"    -> Database updated. Reset {changes} records.")
+
+    # 2. 删除本地文件
+    # 仓库里的图片按内容共享: 只删已经没有其他帖子引用的
+    still_used = ImageStore.reference_counts(conn)
+    conn.close()
+    files = [p for p in wb_paths if p not in still_used]
+    # 旧版平铺文件 (wb_*.jpg)
+    files += glob.glob(os.path.join(IMG_DIR, "wb_*"))
 
     print(f"    -> Found {len(files)} Weibo image files.")
     for f in files:
         try:
             os.remove(f)
+        except FileNotFoundError:
+            pass
         except Exception as e:
             print(f"    [!] Failed to delete {f}: {e}")
 
     print("    -> Local files deleted.")
-
-    # 2. 重置数据库
-    if os.path.exists(DB_NAME):
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-
-        # 将所有微博的 image_path 设为 NULL
-        cursor.execute("UPDATE processed_posts SET image_path = NULL WHERE post_id LIKE 'wb_%'")
-        changes = conn.total_changes
-
-        conn.commit()
-        conn.close()
-        print(f"    -> Database updated. Reset {changes} records.")
-    else:
-        print("    [!] Database not found.")
-
     print("[✅] Cleanup complete. You can run 'backfill_images.py' now.")
 
 
 if __name__ == "__main__":
-    reset()
\ No newline at end of file
+    reset()
@@ -0,0 +1,114 @@
+import os
+from datetime import datetime
+
+# 连续遇到多少条"已经见过"的帖子就认为追上了上次的进度
+KNOWN_STREAK = int(os.getenv("SMTF_KNOWN_STREAK", "5"))
+
+# X / 微博接口的时间格式: "Sat Oct 18 10:00:00 +0800 2025"
+_API_TIME_FORMAT = "%a %b %d %H:%M:%S %z %Y"
+
+
+def parse_ts(value):
+    """把 ISO 8601 / X / 微博接口的时间字符串转成 epoch 秒，认不出来返回 None"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    for parse in (lambda v: datetime.fromisoformat(v.replace("Z", "+00:00")),
+                  lambda v: datetime.strptime(v, _API_TIME_FORMAT)):
+        try:
+            dt = parse(value)
+        except ValueError:
+            continue
+        if dt.tzinfo is None:
+            return None
+        return int(dt.timestamp())
+    return None
+
+
+class HarvestCursor:
+    """
+    单个来源 (X 首页、某个微博博主、Reddit feed) 的增量采集游标。
+    采集端每提取到一条帖子就 observe 一次；连续 streak_limit 条都是"见过的"就 caught_up，停止滚动。
+    "见过的"判定:
+      - 按时间排序的来源 (微博博主时间线)，帖子有时间戳且上次有水位: 时间 <= 水位即为见过
+        (置顶的旧帖只占一条，不会误判)
+      - 算法排序的来源 (X 首页、Reddit): 旧帖随时会插进来，时间戳不能说明"见过"，
+        只看 ID 是否已处理 / 是否就是上次水位那条
+    水位 = 本轮时间戳最新的帖子；没有时间戳时取 feed 顶部第一条新帖。
+    上次没追上 (达到 max_posts 或 feed 到底) 时不推进水位，下次继续往下补。
+    """
+
+    def __init__(self, source, watermark=None, streak_limit=KNOWN_STREAK, chronological=True):
+        self.source = source
+        self.since_id = watermark["newest_id"] if watermark else None
+        self.since_ts = watermark["newest_ts"] if watermark else None
+        self.streak_limit = streak_limit
+        self.chronological = chronological
+
+        self.streak = 0
+        self.caught_up = False
+        self.seen_count = 0
+        self.new_count = 0
+        self.newest_id = None
+        self.newest_ts = None
+
+    def observe(self, post_id, ts=None, known=False):
+        """记录一条帖子，返回它是否被判定为"见过的" """
+        ts = parse_ts(ts)
+        self.seen_count += 1
+        if not known:
+            self.new_count += 1
+        if ts is not None and (self.newest_ts is None or ts > self.newest_ts):
+            self.newest_ts = ts
+            self.newest_id = post_id
+        elif ts is None and self.newest_id is None and not known:
+            self.newest_id = post_id
+
+        if self.chronological and self.since_ts is not None and ts is not None:
+            old = ts <= self.since_ts
+        else:
+            old = known or post_id == self.since_id
+
+        self.streak = self.streak + 1 if old else 0
+        if self.streak >= self.streak_limit:
+            self.caught_up = True
+        return old
+
+    def next_watermark(self):
+        """本轮结束后要写回的 (newest_id, newest_ts)"""
+        if self.newest_id is None:
+            return self.since_id, self.since_ts
+        # 第一次采集 或 已经和上次的进度接上: 水位推进到本轮最新
+        first_run = self.since_id is None and self.since_ts is None
+        if self.caught_up or first_run:
+            stamps = [t for t in (self.newest_ts, self.since_ts) if t is not None]
+            return self.newest_id, max(stamps) if stamps else None
+        return self.since_id, self.since_ts
+
+
+class HarvestCursors:
+    """一次 pipeline 运行里所有来源的游标，结束时统一写回数据库"""
+
+    def __init__(self, db):
+        self.db = db
+        self._saved = db.load_watermarks()
+        self._cursors = {}
+
+    def cursor(self, source, chronological=True):
+        """chronological=False: feed 是算法排序的，只按已处理 ID 判断是否追上"""
+        if source not in self._cursors:
+            self._cursors[source] = HarvestCursor(source, self._saved.get(source), chronological=chronological)
+        return self._cursors[source]
+
+    def save(self):
+        for source, cursor in self._cursors.items():
+            if not cursor.seen_count:
+                continue
+            newest_id, newest_ts = cursor.next_watermark()
+            self.db.set_watermark(source, newest_id, newest_ts, cursor.new_count)
+
+    def report(self):
+        for source, cursor in sorted(self._cursors.items()):
+            status = "caught up" if cursor.caught_up else "not caught up"
+            print(f"    -> [{source}] {cursor.new_count} new / {cursor.seen_count} seen ({status})")
@@ -1,14 +1,83 @@
 import asyncio
-from playwright.async_api import async_playwright
 import os
-import random
-import base64
 import re
-
-
-class WeiboHarvester:
-    def __init__(self, user_data_dir="browser_data", headless=False):
+from contextlib import aclosing
+from browser_session import SessionClient, DomainPacer, TabPool, ScrollDriver
+from image_store import ImageStore
+from media import MediaDownloader, manifest_entry, pop_finished, drain
+
+# api: 走 JSON 接口并发拉取各博主 (失败时退回 DOM)；dom: 逐个页面滚动
+WEIBO_MODE = os.getenv("SMTF_WEIBO_MODE", "api")
+# 接口限速: 相邻请求间隔 (秒) / 最大并发
+WEIBO_API_INTERVAL = float(os.getenv("SMTF_WEIBO_API_INTERVAL", "0.5"))
+WEIBO_API_CONCURRENCY = int(os.getenv("SMTF_WEIBO_API_CONCURRENCY", "4"))
+# 没追上上次水位时最多往后翻几页
+WEIBO_API_MAX_PAGES = int(os.getenv("SMTF_WEIBO_API_MAX_PAGES", "5"))
+
+# DOM 模式: 并行的 tab 数 / 同一域名两次打开页面的最小间隔 (秒)
+WEIBO_TABS = int(os.getenv("SMTF_WEIBO_TABS", "3"))
+WEIBO_TAB_INTERVAL = float(os.getenv("SMTF_WEIBO_TAB_INTERVAL", "1.5"))
+STEALTH_JS = "Object.defineProperty(navigator, 'webdriver', {get: () => undefined});"
+
+API_TIMELINE = "https://weibo.com/ajax/statuses/mymblog?uid={uid}&page={page}&feature=0"
+API_LONGTEXT = "https://weibo.com/ajax/statuses/longtext?id={mblogid}"
+
+IMAGE_BLACKLIST = ["tvax", "tva", "crop", "face", "icon", "avatar", "blank", "us_service", "empty", "skin"]
+
+# 点开可见的"展开"链接 (最多 limit 个)，返回点击数
+EXPAND_JS = """
+(limit) => {
+    let clicked = 0;
+    for (const el of document.querySelectorAll("a, span")) {
+        if (clicked >= limit) break;
+        if (el.children.length || !el.textContent.includes("展开") || !el.offsetParent) continue;
+        el.click();
+        clicked++;
+    }
+    return clicked;
+}
+"""
+
+# 单次注入的提取脚本: 返回当前 DOM 里所有微博的链接 / 作者 / 正文 / 图片。
+# 图片按 woo-picture-main -> pic-box -> 任意 img 的优先级取一组，
+# 并打上 data-smtf-img 编号，截图兜底时用它重新定位元素。
+EXTRACT_WEIBO_JS = """
+() => {
+    window.__smtfImgSeq = window.__smtfImgSeq || 0;
+    return Array.from(document.querySelectorAll("article")).map(el => {
+        let imgs = [];
+        for (const sel of [".woo-picture-main img", ".pic-box img", "img"]) {
+            imgs = Array.from(el.querySelectorAll(sel));
+            if (imgs.length) break;
+        }
+        const author = el.querySelector('header a[href*="/u/"]');
+        return {
+            hrefs: Array.from(el.querySelectorAll("a[href]")).map(a => a.getAttribute("href")),
+            author: author ? author.textContent.trim() : "",
+            text: el.innerText,
+            media: imgs.map(img => {
+                if (!img.dataset.smtfImg) img.dataset.smtfImg = String(++window.__smtfImgSeq);
+                return {
+                    url: img.getAttribute("src"), width: img.naturalWidth, height: img.naturalHeight,
+                    ref: img.dataset.smtfImg
+                };
+            })
+        };
+    });
+}
+"""
+
+
+class WeiboHarvester(SessionClient):
+    def __init__(self, user_data_dir="browser_data", headless=False, session=None, mode=WEIBO_MODE):
         self.headless = headless
+        self.session = session
+        self.mode = mode
+        self.pacer = DomainPacer(WEIBO_API_INTERVAL, WEIBO_API_CONCURRENCY)
+        self._api_failed = False
+        self._patched_page = None
+        self.images = ImageStore()
+        self.media = MediaDownloader(self.images)
         self.source_prefix = "wb"
         self.target_urls = [
             "https://weibo.com/u/7378302827",
@@ -17,239 +86,357 @@ class WeiboHarvester:
             "https://weibo.com/u/1642088277",
         ]
 
-    async def harvest(self, max_posts=5):
-        return await self.harvest_weibo(max_posts)
-
-    async def _download_image_via_js(self, page, url):
-        js_code = """
-        async (url) => {
-            try {
-                const response = await fetch(url);
-                if (!response.ok) return null;
-                const blob = await response.blob();
-                return new Promise((resolve, reject) => {
-                    const reader = new FileReader();
-                    reader.onloadend = () => resolve(reader.result);
-                    reader.onerror = reject;
-                    reader.readAsDataURL(blob);
-                });
-            } catch (err) { return null; }
-        }
+    def stream(self, max_posts=5, known_ids=None, cursors=None):
+        """
+        微博: 命中 known_ids 的帖子在下载图片之前就跳过；每个博主一个水位 (wb:<uid>)，按发布时间判断追上。
         """
+        return self.harvest_weibo(max_posts, known_ids, cursors)
+
+    async def _attach_image(self, page, post, image_url, element, text_len):
+        """图片下载完成后补上 image_path；拿不到图且正文太短的帖子丢弃"""
         try:
-            data_url = await page.evaluate(js_code, url)
-            if data_url and "base64," in data_url:
-                _, encoded = data_url.split(",", 1)
-                return base64.b64decode(encoded)
-        except:
-            pass
+            post["image_path"] = await self.media.save(
+                page, image_url, referer="https://weibo.com/", fallback_element=element, quality=80
+            )
+        except Exception as e:
+            print(f"    [!] Image download failed ({post['id']}): {e}")
+        if text_len >= 5 or post["image_path"]:
+            return post
         return None
 
-    async def harvest_weibo(self, max_posts=5):
-        print(f"[*] [Weibo] Connecting to Canary (Port 9222)...")
-
-        async with async_playwright() as p:
+    # ==========================
+    # API 模式: 直接走站点的 JSON 接口
+    # ==========================
+    def _profile_uids(self):
+        uids = []
+        for url in self.target_urls:
+            match = re.search(r"/u/(\d+)", url)
+            if match:
+                uids.append(match.group(1))
+        return uids
+
+    async def _api_headers(self, page):
+        # 带上 XSRF token，和页面自己发的 ajax 请求保持一致
+        headers = {"Referer": "https://weibo.com/", "X-Requested-With": "XMLHttpRequest"}
+        try:
+            for cookie in await page.context.cookies("https://weibo.com"):
+                if cookie["name"] == "XSRF-TOKEN":
+                    headers["X-XSRF-TOKEN"] = cookie["value"]
+        except Exception:
+            pass
+        return headers
+
+    async def _get_json(self, page, url, headers):
+        async with self.pacer.slot():
+            response = await page.request.get(url, headers=headers, timeout=20000)
+            if response.status != 200:
+                raise RuntimeError(f"HTTP {response.status}")
+            data = await response.json()
+        if data.get("ok") != 1:
+            raise RuntimeError(f"ok={data.get('ok')}")
+        return data
+
+    async def _fetch_profile(self, page, uid, headers, max_posts, known_ids, cursor=None):
+        """
+        拉一个博主的时间线，返回还没处理过的微博 (最多 max_posts 条)。
+        默认只看第一页；一页全是新内容 (还没接上上次的水位) 时继续往后翻，最多 WEIBO_API_MAX_PAGES 页。
+        """
+        statuses = []
+        for page_no in range(1, WEIBO_API_MAX_PAGES + 1):
+            data = await self._get_json(page, API_TIMELINE.format(uid=uid, page=page_no), headers)
+            items = (data.get("data") or {}).get("list", [])
+            for status in items:
+                if len(statuses) >= max_posts: break
+                mblogid = status.get("mblogid")
+                if not mblogid: continue
+                unique_id = f"{self.source_prefix}_{mblogid}"
+                known = known_ids is not None and unique_id in known_ids
+                # 置顶微博不参与水位判断
+                if cursor and not status.get("isTop"):
+                    cursor.observe(unique_id, status.get("created_at"), known=known)
+                if known: continue
+                statuses.append((unique_id, status))
+
+            if not items or len(statuses) >= max_posts or cursor is None or cursor.caught_up:
+                break
+        return uid, statuses
+
+    async def _build_api_post(self, page, uid, unique_id, status, headers):
+        text = status.get("text_raw") or ""
+        # 长微博: 单独拉全文，不再逐个点"展开"
+        if status.get("isLongText"):
             try:
-                browser = await p.chromium.connect_over_cdp("http://127.0.0.1:9222")
-                default_context = browser.contexts[0]
+                data = await self._get_json(page, API_LONGTEXT.format(mblogid=status["mblogid"]), headers)
+                text = (data.get("data") or {}).get("longTextContent") or text
             except Exception as e:
-                print(f"    [!] Connection failed: {e}")
-                return []
-
-            page = None
-            for p_tab in default_context.pages:
-                if "weibo.com" in p_tab.url:
-                    page = p_tab
-                    print("    -> Found existing Weibo tab.")
-                    break
-
-            if not page:
-                print("    -> Opening new Weibo tab...")
-                page = await default_context.new_page()
-                await page.goto(self.target_urls[0])
-
-            await page.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined});")
-
-            all_posts = []
-            os.makedirs("assets/images", exist_ok=True)
+                print(f"    [!] [Weibo] Long text failed ({unique_id}): {e}")
+
+        clean_text = text.replace("\n", " ").strip()
+        post = {
+            "id": unique_id,
+            "text": f"[Weibo] {clean_text[:600]}",
+            "url": f"https://weibo.com/{uid}/{status['mblogid']}",
+            "image_path": None,
+            "media": []
+        }
 
+        # 整组图片 (原图尺寸) 记进 media 清单，只下载第一张送审
+        pic_infos = status.get("pic_infos") or {}
+        for pid in status.get("pic_ids") or []:
+            info = pic_infos.get(pid) or {}
+            best = info.get("largest") or info.get("large") or {}
+            if best.get("url"):
+                post["media"].append(manifest_entry(best["url"], best.get("width"), best.get("height")))
+        if post["media"]:
             try:
-                await page.wait_for_selector('article', timeout=5000)
-            except:
-                print("    [!] Waiting for login...")
-                try:
-                    await page.wait_for_selector('article', timeout=0)
-                except:
-                    return []
-
-            # --- 2. 循环抓取 ---
-            for url in self.target_urls:
-                print(f"    -> Visiting: {url}")
+                post["image_path"] = await self.media.save(page, post["media"][0]["url"], referer="https://weibo.com/")
+            except Exception as e:
+                print(f"    [!] Image download failed ({unique_id}): {e}")
 
-                # [核心修复] 重置当前博主的计数器
-                posts_from_this_user = 0
+        if len(clean_text) < 5 and not post["image_path"]:
+            return None
+        return post
 
+    async def _harvest_api(self, page, max_posts, known_ids, cursors=None):
+        """
+        各博主的时间线并发拉取 (受 pacer 限速)，长文和图片也并发处理，
+        哪条先处理完先吐哪条。博主数量增加时总耗时主要取决于限速而不是串行滚动。
+        全部博主都失败时把 self._api_failed 置为 True，由调用方退回 DOM 模式。
+        """
+        self._api_failed = False
+        headers = await self._api_headers(page)
+        uids = self._profile_uids()
+        profiles = [
+            asyncio.create_task(self._fetch_profile(
+                page, uid, headers, max_posts, known_ids, cursors.cursor(f"wb:{uid}") if cursors else None
+            ))
+            for uid in uids
+        ]
+        pending = set()
+        failures = 0
+        try:
+            for future in asyncio.as_completed(profiles):
                 try:
-                    if page.url != url:
-                        await page.goto(url, wait_until="domcontentloaded")
-                        await asyncio.sleep(3)
-
-                    last_article_count = 0
-
-                    for scroll_round in range(3):
-                        # [检查点 1] 如果这个博主已经抓够了，跳出滚动循环，直接去下一个博主
-                        if posts_from_this_user >= max_posts:
-                            print(f"       (Target reached for this user: {posts_from_this_user})")
-                            break
-
-                        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                        await asyncio.sleep(2.5)
-
-                        try:
-                            expand_links = await page.locator("a:has-text('展开'), span:has-text('展开')").all()
-                            for link in expand_links[:3]:
-                                if await link.is_visible():
-                                    await link.click()
-                                    await asyncio.sleep(0.2)
-                        except:
-                            pass
-
-                        articles = await page.locator('article').all()
-                        current_count = len(articles)
-                        # print(f"       (Round {scroll_round + 1}) DOM has {current_count} articles.")
-
-                        last_article_count = current_count
-
-                        for i, article in enumerate(articles):
-                            # [检查点 2] 再次检查当前博主是否抓够了
-                            if posts_from_this_user >= max_posts: break
-
-                            try:
-                                raw_text = await article.inner_text()
-                                content_preview = raw_text.replace('\n', ' ')[:15]
-
-                                # --- ID/URL 提取 ---
-                                found_id = None
-                                found_url = ""
-                                links = await article.locator("a").all()
-                                for link in links:
-                                    href = await link.get_attribute("href")
-                                    if not href: continue
-                                    if ("/status/" in href) or (
-                                            "weibo.com/" in href and "/u/" not in href and len(href.split("/")) > 4):
-                                        if href.startswith("//"):
-                                            temp_url = "https:" + href
-                                        elif href.startswith("/"):
-                                            temp_url = "https://weibo.com" + href
-                                        else:
-                                            temp_url = href
-
-                                        parts = temp_url.split("?")[0].split("/")
-                                        candidate_id = parts[-1]
-                                        if candidate_id.isdigit() and len(candidate_id) == 10: continue
-                                        if len(candidate_id) > 5:
-                                            found_id = candidate_id
-                                            found_url = temp_url
-                                            break
-
-                                clean_text = raw_text.replace("\n", " ").strip()
-
-                                if found_id:
-                                    unique_id = f"{self.source_prefix}_{found_id}"
-                                else:
-                                    unique_id = f"{self.source_prefix}_hash_{hash(clean_text[:50])}"
-
-                                # 去重 (仅跳过，不计入有效抓取)
-                                if unique_id in [p['id'] for p in all_posts]: continue
-
-                                # --- 图片下载 ---
-                                image_local_path = None
-                                target_img_element = None
-                                target_src_hd = None
-
-                                locators = ['article .woo-picture-main img', 'article .pic-box img', 'article img']
-                                found_imgs = []
-                                for loc in locators:
-                                    found_imgs = await article.locator(loc.replace('article ', '')).all()
-                                    if found_imgs: break
-
-                                for img in found_imgs:
-                                    try:
-                                        src = await img.get_attribute("src")
-                                        if not src: continue
-                                        if src.startswith("//"): src = "https:" + src
-
-                                        blacklist = ["tvax", "tva", "crop", "face", "icon", "avatar", "blank",
-                                                     "us_service", "empty", "skin"]
-                                        if any(x in src for x in blacklist): continue
-                                        if ".png" in src or ".svg" in src: continue
-
-                                        try:
-                                            width = await img.evaluate("el => el.naturalWidth")
-                                            if 0 < width < 150: continue
-                                        except:
-                                            pass
-
-                                        target_img_element = img
-                                        high_res = src
-                                        for pattern in ["/mw690/", "/orj360/", "/thumbnail/", "/bmiddle/", "/thumb180/",
-                                                        "/small/", "/dr/"]:
-                                            high_res = high_res.replace(pattern, "/large/")
-                                        target_src_hd = high_res
-                                        break
-                                    except:
-                                        continue
-
-                                if target_img_element:
-                                    filename = f"assets/images/{unique_id}.jpg"
-                                    downloaded = False
-
-                                    if target_src_hd:
-                                        img_bytes = await self._download_image_via_js(page, target_src_hd)
-                                        if img_bytes and len(img_bytes) > 2000:
-                                            with open(filename, "wb") as f:
-                                                f.write(img_bytes)
-                                            image_local_path = filename
-                                            downloaded = True
-
-                                    if not downloaded:
-                                        try:
-                                            await target_img_element.scroll_into_view_if_needed()
-                                            await asyncio.sleep(0.3)
-                                            await target_img_element.screenshot(path=filename, type="jpeg", quality=80)
-                                            image_local_path = filename
-                                            downloaded = True
-                                        except:
-                                            pass
-
-                                if len(clean_text) < 5 and not image_local_path: continue
-
-                                print(f"       [+] Added: {unique_id} | {content_preview}...")
-                                all_posts.append({
-                                    "id": unique_id,
-                                    "text": f"[Weibo] {clean_text[:600]}",
-                                    "url": found_url,
-                                    "image_path": image_local_path
-                                })
-                                # [核心] 有效计数器 +1
-                                posts_from_this_user += 1
-
-                            except Exception:
-                                continue
-
-                        # 再次滚动
-                        await page.mouse.wheel(0, 500)
-
+                    uid, statuses = await future
                 except Exception as e:
-                    print(f"    [!] Error visiting {url}: {e}")
+                    failures += 1
+                    print(f"    [!] [Weibo] Profile API failed: {e}")
+                    continue
+                print(f"    -> [Weibo] u/{uid}: {len(statuses)} new posts")
+                for unique_id, status in statuses:
+                    pending.add(asyncio.create_task(self._build_api_post(page, uid, unique_id, status, headers)))
+                for post in pop_finished(pending):
+                    yield post
+
+            async for post in drain(pending):
+                yield post
+        finally:
+            for task in list(profiles) + list(pending):
+                task.cancel()
+
+        self._api_failed = bool(uids) and failures == len(uids)
+
+    async def _scrape_profile(self, page, url, max_posts, known_ids, cursor=None):
+        """DOM 模式下抓一个博主 (在 TabPool 的某个 tab 里运行)，返回帖子列表"""
+        posts = []
+        seen_ids = set()
+        pending = set()  # 图片还在下载的帖子
+        try:
+            print(f"    -> Visiting: {url}")
 
-            print(f"    -> [Weibo] Harvest complete.")
-            await browser.close()
-            return all_posts
+            # [核心修复] 重置当前博主的计数器
+            posts_from_this_user = 0
 
+            try:
+                await page.goto(url, wait_until="domcontentloaded")
+                await page.wait_for_selector("article", timeout=15000)
+
+                # 滚到底后等新的 article 插入再处理，不再固定 sleep
+                scroller = ScrollDriver(page, "article")
+                async for scroll_round in scroller.rounds():
+                    # 展开长文: 一次脚本点完可见的"展开"，不再逐个 locator 往返
+                    try:
+                        clicked = await page.evaluate(EXPAND_JS, 3)
+                        if clicked:
+                            await asyncio.sleep(0.2 * clicked)
+                    except:
+                        pass
+
+                    # 一次 evaluate 拿到整屏微博的结构化数据
+                    try:
+                        articles = await page.evaluate(EXTRACT_WEIBO_JS)
+                    except Exception as e:
+                        print(f"    [!] Extraction failed: {e}")
+                        articles = []
+
+                    for article in articles:
+                        # [检查点 2] 再次检查当前博主是否抓够了
+                        if posts_from_this_user >= max_posts: break
+
+                        raw_text = article["text"] or ""
+                        content_preview = raw_text.replace('\n', ' ')[:15]
+
+                        # --- ID/URL 提取 ---
+                        found_id = None
+                        found_url = ""
+                        for href in article["hrefs"]:
+                            if ("/status/" in href) or (
+                                    "weibo.com/" in href and "/u/" not in href and len(href.split("/")) > 4):
+                                if href.startswith("//"):
+                                    temp_url = "https:" + href
+                                elif href.startswith("/"):
+                                    temp_url = "https://weibo.com" + href
+                                else:
+                                    temp_url = href
+
+                                parts = temp_url.split("?")[0].split("/")
+                                candidate_id = parts[-1]
+                                if candidate_id.isdigit() and len(candidate_id) == 10: continue
+                                if len(candidate_id) > 5:
+                                    found_id = candidate_id
+                                    found_url = temp_url
+                                    break
+
+                        clean_text = raw_text.replace("\n", " ").strip()
+
+                        if found_id:
+                            unique_id = f"{self.source_prefix}_{found_id}"
+                        else:
+                            unique_id = f"{self.source_prefix}_hash_{hash(clean_text[:50])}"
+
+                        # 去重 (仅跳过，不计入有效抓取)
+                        if unique_id in seen_ids: continue
+
+                        # 已经处理过的帖子: 不下载图片，直接跳过
+                        if known_ids is not None and unique_id in known_ids:
+                            seen_ids.add(unique_id)
+                            if cursor:
+                                cursor.observe(unique_id, known=True)
+                            continue
+
+                        # --- 图片挑选 (尺寸在脚本里已经读好，不再逐张 evaluate) ---
+                        # 第一张合格的图下载送审，其余的只记进 media 清单
+                        target_img = None
+                        target_src_hd = None
+                        media = []
+                        for img in article["media"]:
+                            src = img["url"]
+                            if not src: continue
+                            if src.startswith("//"): src = "https:" + src
+
+                            if any(x in src for x in IMAGE_BLACKLIST): continue
+                            if ".png" in src or ".svg" in src: continue
+                            if 0 < img["width"] < 150: continue
+
+                            high_res = src
+                            for pattern in ["/mw690/", "/orj360/", "/thumbnail/", "/bmiddle/", "/thumb180/",
+                                            "/small/", "/dr/"]:
+                                high_res = high_res.replace(pattern, "/large/")
+                            # DOM 里只有缩略图的尺寸，原图尺寸未知
+                            media.append(manifest_entry(high_res))
+                            if target_img is None:
+                                target_img = page.locator(f'img[data-smtf-img="{img["ref"]}"]')
+                                target_src_hd = high_res
+
+                        if len(clean_text) < 5 and target_img is None: continue
+
+                        print(f"       [+] Added: {unique_id} | {content_preview}...")
+                        seen_ids.add(unique_id)
+                        # [核心] 有效计数器 +1
+                        posts_from_this_user += 1
+                        if cursor:
+                            cursor.observe(unique_id)
+                        post = {
+                            "id": unique_id,
+                            "text": f"[Weibo] {clean_text[:600]}",
+                            "url": found_url,
+                            "image_path": None,
+                            "media": media
+                        }
+                        if target_img is not None:
+                            # 下载交给 MediaDownloader 并发进行，失败时对元素截图兜底
+                            pending.add(asyncio.create_task(
+                                self._attach_image(page, post, target_src_hd, target_img, len(clean_text))
+                            ))
+                        else:
+                            posts.append(post)
+
+                    # 图片已下载完的帖子先收下
+                    posts.extend(pop_finished(pending))
+
+                    # [检查点 1] 如果这个博主已经抓够了，停止滚动，tab 交还给池子
+                    if posts_from_this_user >= max_posts:
+                        print(f"       (Target reached for this user: {posts_from_this_user})")
+                        break
+                    if cursor and cursor.caught_up:
+                        print("       (Caught up with the last run, stop scrolling)")
+                        break
+
+                # tab 交还之前等本页的下载收尾 (截图兜底要用到本页的元素)
+                posts.extend([post async for post in drain(pending)])
 
-if __name__ == "__main__":
+            except Exception as e:
+                print(f"    [!] Error visiting {url}: {e}")
+                # 交给 TabPool 换 tab 重试
+                raise
+        finally:
+            for task in pending:
+                task.cancel()
+        return posts
+
+    async def harvest_weibo(self, max_posts=5, known_ids=None, cursors=None):
+        print(f"[*] [Weibo] Attaching to shared browser session...")
+
+        session = self._get_session()
+        try:
+            page = await session.get_page("weibo", ("weibo.com",), self.target_urls[0])
+        except Exception as e:
+            print(f"    [!] Connection failed: {e}")
+            return
+
+        # init script 会累积，每个 tab 只注入一次
+        if page is not self._patched_page:
+            await page.add_init_script(STEALTH_JS)
+            self._patched_page = page
+
+        # 登录状态在同一会话内只检查一次
+        if not await session.ensure_login("weibo", page, 'article', timeout=5000):
+            return
+
+        if self.mode == "api":
+            async with aclosing(self._harvest_api(page, max_posts, known_ids, cursors)) as posts:
+                async for post in posts:
+                    yield post
+            if not self._api_failed:
+                print(f"    -> [Weibo] Harvest complete.")
+                return
+            print("    [!] [Weibo] API mode failed for every profile, falling back to DOM...")
+
+        # --- 2. 多 tab 并行抓取各博主 ---
+        pool = TabPool(session, size=WEIBO_TABS, interval=WEIBO_TAB_INTERVAL, init_script=STEALTH_JS)
+
+        async def worker(tab, url):
+            uid = re.search(r"/u/(\d+)", url)
+            cursor = cursors.cursor(f"wb:{uid.group(1)}") if cursors and uid else None
+            return await self._scrape_profile(tab, url, max_posts, known_ids, cursor)
+
+        async with aclosing(pool.run(self.target_urls, worker)) as results:
+            async for url, posts in results:
+                for post in posts or []:
+                    yield post
+
+        print(f"    -> [Weibo] Harvest complete.")
+
+
+async def _main():
     wb = WeiboHarvester(headless=False)
-    data = asyncio.run(wb.harvest(5))
+    try:
+        data = await wb.harvest(5)
+    finally:
+        await wb.close()
     for item in data:
-        print(f"ID: {item['id']}")
\ No newline at end of file
+        print(f"ID: {item['id']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
\ No newline at end of file